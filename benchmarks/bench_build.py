@@ -0,0 +1,191 @@
+"""
+Build pipeline benchmarks on synthetic asset trees.
+
+Generates an input tree of N files, registers a set of stdlib-only tools and times:
+- plan       : the planning phase alone (tool matching, outputs, dependencies)
+- cold       : a full build with an empty output folder and no cache
+- noop       : a rebuild where nothing changed
+- one_change : a rebuild after a single chained input file was edited
+
+The tree is a mix of `.txt` files (CopyingTool), `.bin` files (CompressionTool), `.dat` files
+(LinkingTool) and `.s0` files that go through a chain of `--depth` StageTools. The first stage
+of the chain writes `--fan-out` outputs per input, every later stage is one to one.
+
+Results are compared against a stored baseline (timings are machine dependent, so refresh it
+with --update-baseline when moving to a new machine):
+
+    python benchmarks/bench_build.py --sizes 1000 10000
+    python benchmarks/bench_build.py --sizes 1000 --update-baseline
+"""
+import AssetForge
+from AssetForge.core import AssetForge as Forge, _plan_build
+
+from pathlib import Path
+from typing import List, Dict
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+
+BASELINE = Path(__file__).parent / "baseline.json"
+SCENARIOS = ["plan", "cold", "noop", "one_change"]
+
+class StageTool(AssetForge.AssetTool):
+    """
+    Turns `<name>.s<stage>` into `<name>.s<stage + 1>` (or `fan_out` files `<name>.<i>.s<stage + 1>`)
+    in the output folder. Every output is the crc32 of the input followed by the input bytes.
+    """
+    def __init__(self, stage: int, fan_out: int = 1):
+        super().__init__()
+        self.stage = stage
+        self.fan_out = fan_out
+
+    def tool_name(self):
+        return f"StageTool{self.stage}"
+
+    def check_match(self, file_path: Path) -> bool:
+        return file_path.suffix == f".s{self.stage}"
+
+    def define_dependencies(self, file_path: Path) -> List[Path]:
+        return []
+
+    def define_outputs(self, file_path: Path) -> List[Path]:
+        rel = self.relative_path(file_path)
+        if self.fan_out == 1:
+            return [self.output_folder / rel.with_suffix(f".s{self.stage + 1}")]
+        return [self.output_folder / rel.with_suffix(f".{i}.s{self.stage + 1}") for i in range(self.fan_out)]
+
+    def build(self, file_path: Path) -> None:
+        data = file_path.read_bytes()
+        payload = zlib.crc32(data).to_bytes(4, "little") + data
+
+        for output in self.define_outputs(file_path):
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_bytes(payload)
+
+def register_tools(depth: int, fan_out: int) -> None:
+    forge = Forge()
+    forge.tools.clear()
+
+    AssetForge.RegisterTool(AssetForge.common.CopyingTool(pattern=r"^.*\.txt$"), priority=1)
+    AssetForge.RegisterTool(AssetForge.common.CompressionTool(), priority=5)
+    AssetForge.RegisterTool(AssetForge.common.LinkingTool(pattern=r"^.*\.dat$"), priority=0)
+
+    for stage in range(depth):
+        AssetForge.RegisterTool(StageTool(stage, fan_out if stage == 0 else 1), priority=3)
+
+def generate_tree(root: Path, num_files: int, files_per_folder: int = 100) -> List[Path]:
+    """Writes num_files small files spread over folders of files_per_folder and returns the chained ones."""
+    suffixes = [".txt", ".bin", ".dat", ".s0"]
+    chained = []
+
+    for i in range(num_files):
+        folder = root / f"group_{i // files_per_folder:05d}"
+        folder.mkdir(parents=True, exist_ok=True)
+
+        file = folder / f"asset_{i:06d}{suffixes[i % len(suffixes)]}"
+        file.write_bytes(f"asset {i}\n".encode() * 8)
+
+        if file.suffix == ".s0":
+            chained.append(file)
+
+    return chained
+
+def timed(func, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+def run_case(num_files: int, depth: int, fan_out: int, workdir: Path, hash_algorithm: str = "sha256") -> Dict[str, float]:
+    input_folder = workdir / "assets"
+    output_folder = workdir / "build"
+
+    chained = generate_tree(input_folder, num_files)
+    register_tools(depth, fan_out)
+
+    results = {}
+    results["plan"] = timed(_plan_build, Forge(), input_folder, output_folder)
+    results["cold"] = timed(AssetForge.Build, input_folder, output_folder, hash_algorithm=hash_algorithm)
+    results["noop"] = timed(AssetForge.Build, input_folder, output_folder, hash_algorithm=hash_algorithm)
+
+    with open(chained[len(chained) // 2], "ab") as f:
+        f.write(b"edit\n")
+
+    results["one_change"] = timed(AssetForge.Build, input_folder, output_folder, hash_algorithm=hash_algorithm)
+
+    return results
+
+def case_key(num_files: int, depth: int, fan_out: int, hash_algorithm: str = "sha256") -> str:
+    key = f"n={num_files},depth={depth},fan_out={fan_out}"
+    if hash_algorithm != "sha256":
+        key += f",hash={hash_algorithm}"
+    return key
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000], help="number of input files, e.g. 1000 10000 100000")
+    parser.add_argument("--depth", type=int, default=2, help="length of the StageTool chain")
+    parser.add_argument("--fan-out", type=int, default=2, help="outputs per job in the first stage of the chain")
+    parser.add_argument("--hash-algorithm", default="sha256", help="passed to Build, e.g. blake2b or xxh3")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per size, the fastest one is kept")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown relative to the baseline")
+    parser.add_argument("--workdir", type=Path, default=None, help="where to generate the trees (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {}
+
+    results = {}
+    regressions = []
+
+    for num_files in args.sizes:
+        key = case_key(num_files, args.depth, args.fan_out, args.hash_algorithm)
+        best = None
+
+        for _ in range(args.repeat):
+            workdir = Path(tempfile.mkdtemp(prefix="assetforge_bench_", dir=args.workdir))
+            try:
+                run = run_case(num_files, args.depth, args.fan_out, workdir, args.hash_algorithm)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+            best = run if best is None else {s: min(best[s], run[s]) for s in SCENARIOS}
+
+        results[key] = best
+
+        print(key)
+        for scenario in SCENARIOS:
+            line = f"    {scenario.ljust(10)} {best[scenario]:9.3f}s"
+            old = baseline.get(key, {}).get(scenario)
+            if old:
+                ratio = best[scenario] / old
+                line += f"  baseline {old:9.3f}s  x{ratio:.2f}"
+                if ratio > 1 + args.tolerance:
+                    line += "  REGRESSION"
+                    regressions.append(f"{key} {scenario}")
+            print(line)
+
+    if args.update_baseline:
+        baseline.update({k: {s: round(v, 4) for s, v in r.items()} for k, r in results.items()})
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Distributed build check with several workers on localhost.
+
+Generates the same synthetic tree as bench_build.py, builds it once locally and once with --workers worker
+processes connected over TCP on 127.0.0.1, and compares the two output folders byte for byte. Along the way:
+- a worker with the wrong secret tries to connect and has to be turned away
+- with --kill, one worker is killed after a few jobs, its job has to be picked up by the others
+- with --ship-outputs, the workers build from their own copy of the assets and send the outputs back
+
+    python benchmarks/local_workers.py --workers 4 --kill
+    python benchmarks/local_workers.py --workers 2 --ship-outputs
+"""
+import AssetForge
+
+from bench_build import generate_tree, register_tools, timed
+
+from pathlib import Path
+from typing import Dict
+
+import argparse
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SECRET = "local-workers-check"
+
+def output_files(folder: Path) -> Dict[str, Path]:
+    return {str(p.relative_to(folder)): p for p in folder.rglob("*") if p.is_file() or p.is_symlink()}
+
+def same_outputs(expected: Path, actual: Path) -> bool:
+    a, b = output_files(expected), output_files(actual)
+    if a.keys() != b.keys():
+        print(f"different files: {sorted(a.keys() ^ b.keys())[:10]}")
+        return False
+
+    different = [f for f in a if a[f].is_symlink() != b[f].is_symlink() or not filecmp.cmp(a[f], b[f], shallow=False)]
+    if different:
+        print(f"different contents: {different[:10]}")
+    return not different
+
+def start_worker(address: str, cwd: Path, args) -> subprocess.Popen:
+    env = dict(os.environ, ASSETFORGE_SECRET=SECRET)
+    command = [sys.executable, os.path.abspath(__file__), "--worker", address, "--depth", str(args.depth), "--fan-out", str(args.fan_out)]
+    return subprocess.Popen(command, cwd=cwd, env=env)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3, help="number of worker processes")
+    parser.add_argument("--files", type=int, default=1000, help="number of input files")
+    parser.add_argument("--depth", type=int, default=2, help="length of the StageTool chain")
+    parser.add_argument("--fan-out", type=int, default=2, help="outputs per job in the first stage of the chain")
+    parser.add_argument("--port", type=int, default=5620)
+    parser.add_argument("--kill", action="store_true", help="kill one worker in the middle of the build")
+    parser.add_argument("--ship-outputs", action="store_true", help="workers build in their own folder and send the outputs back")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS) # runs this script as one of the workers
+    args = parser.parse_args(argv)
+
+    register_tools(args.depth, args.fan_out)
+
+    if args.worker is not None:
+        AssetForge.Worker(args.worker, persistent=False)
+        return 0
+
+    address = f"127.0.0.1:{args.port}"
+    workdir = Path(tempfile.mkdtemp(prefix="assetforge_workers_"))
+    old_cwd = os.getcwd()
+    workers = []
+
+    try:
+        os.chdir(workdir) # jobs are sent with paths relative to the working directory, like Amake.py's
+        generate_tree(Path("assets"), args.files)
+
+        local = timed(AssetForge.Build, Path("assets"), Path("expected"))
+        os.remove("assets/cache.log")
+
+        worker_dirs = []
+        for i in range(args.workers):
+            if args.ship_outputs:
+                folder = workdir / f"worker_{i}"
+                shutil.copytree("assets", folder / "assets")
+            else:
+                folder = workdir
+            worker_dirs.append(folder)
+            workers.append(start_worker(address, folder, args))
+
+        # Turned away at the handshake, so it returns right after connecting without taking a job.
+        intruder = threading.Thread(target=AssetForge.Worker, args=(address,), kwargs={"retry": 30.0, "persistent": False, "secret": "wrong"})
+        intruder.start()
+
+        finished = [0]
+        def on_finished(event):
+            finished[0] += 1
+            if args.kill and finished[0] == 20 and workers[0].poll() is None:
+                workers[0].kill()
+                print(f"killed worker 0 after {finished[0]} jobs")
+
+        distributed = timed(AssetForge.Build, Path("assets"), Path("build"), workers=address, wait_for_workers=10.0, worker_secret=SECRET,
+                            ship_outputs=args.ship_outputs, sinks=[AssetForge.CallbackSink(on_finished, ("finished",))])
+
+        intruder.join(10.0)
+        print(f"local build {local:.3f}s, {args.workers} workers {distributed:.3f}s")
+
+        if intruder.is_alive():
+            print("FAILED: the worker with the wrong secret wasn't turned away")
+            return 1
+
+        if args.ship_outputs and not any((folder / "build").exists() for folder in worker_dirs):
+            print("FAILED: no worker built anything")
+            return 1
+
+        if not same_outputs(Path("expected"), Path("build")):
+            print("FAILED: the distributed build differs from the local one")
+            return 1
+
+        print("ok: outputs match the local build")
+        return 0
+    finally:
+        for worker in workers:
+            try:
+                worker.wait(10.0)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+        os.chdir(old_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@ import AssetForge
 
 from pathlib import Path
 
+import sys
+
 from amake import atlas, svg
 
 AssetForge.RegisterTool(AssetForge.common.CopyingTool(pattern=r"^.*\.txt$"),  priority=1)  
@@ -10,4 +12,7 @@ AssetForge.RegisterTool(AssetForge.common.IgnoreItToolDecorator(AssetForge.commo
 AssetForge.RegisterTool(atlas.AtlasTool(),                                    priority=3)  
 AssetForge.RegisterTool(svg.SVGtoPNGTool(),                                   priority=3)  
 
-AssetForge.Build(Path("assets"), Path("build"), recursive=True, parallel=False, debug=True, quiet=True)
\ No newline at end of file
+if len(sys.argv) > 2 and sys.argv[1] == "--worker":
+    AssetForge.Worker(sys.argv[2]) # ASSETFORGE_SECRET=... python Amake.py --worker build-server:5555
+else:
+    AssetForge.Build(Path("assets"), Path("build"), recursive=True, parallel=False, debug=True, quiet=True)
\ No newline at end of file
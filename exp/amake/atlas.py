@@ -6,10 +6,23 @@ from pathlib import Path
 from typing import List, Dict, Tuple
 from PIL import Image
 
+from .packing import pack_rects, repack_rects
+
+SPRITE_SUFFIXES = {".png", ".bmp", ".tga", ".jpg", ".jpeg", ".gif"}
+
 class AtlasTool(AssetForge.AssetTool):
     """
     AtlasTool implements AssetTool.
 
+    Atlas types:
+    - "single_image": a hand made sprite sheet, "image" is the sheet and "entries" list the rects in it.
+    - "packed": every image in "folder" (relative to the .atlas file) is packed into a sheet with MaxRects.
+      Optional keys: "padding" (default 1), "max_size" (default 4096), "power_of_two" (default true).
+      Outputs the sheet as .atlas.png next to the .atlas.bin, and a .atlas.layout JSON with the slot of
+      every sprite. When a sprite changes but still fits in its old slot the layout is reused, so the
+      UVs of the other sprites stay the same and only the sheet is recomposed.
+      Entry ids are the sprite paths relative to "folder" without the suffix, e.g. "hero/walk_0".
+
     Binary format:
     - Unsigned int (4 bytes): number of entries.
     - Unsigned int (4 bytes): size of text blob.
@@ -69,33 +82,44 @@ class AtlasTool(AssetForge.AssetTool):
         return file_path.suffixes.count(".atlas") == 1 and file_path.is_relative_to(self.input_folder)
 
     def define_dependencies(self, file_path: Path) -> List[Path]:
-        # The JSON atlas file references an image.
+        # The image or sprite folder is only known after parsing the JSON, so build() records it instead.
+        return []
+
+    def define_outputs(self, file_path: Path) -> List[Path]:
+        outputs = [self.output_folder / self.relative_path(file_path.with_suffix(".atlas.bin"))]
+
         try:
-            with file_path.open("r", encoding="utf-8") as f:
-                data = json.load(f)
-            if data["type"] == "single_image":
-                return [file_path.parent / Path(data["image"])]
-            else:
-                raise NotImplementedError("Haven't implemented that type of atlas yet")
+            if self.load_atlas(file_path).get("type") == "packed":
+                outputs.append(self.output_folder / self.relative_path(file_path.with_suffix(".atlas.png")))
+                outputs.append(self.output_folder / self.relative_path(file_path.with_suffix(".atlas.layout")))
         except Exception as e:
             print(f"Atlas Error reading {file_path}: {e}")
-        
-        return []
 
-    def define_outputs(self, file_path: Path) -> List[Path]:
-        return [self.output_folder / self.relative_path(file_path.with_suffix(".atlas.bin"))]
+        return outputs
+
+    def load_atlas(self, file_path: Path) -> Dict:
+        with file_path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def sprite_files(self, folder: Path) -> List[Path]:
+        return sorted(f for f in folder.rglob("*") if f.is_file() and f.suffix.lower() in SPRITE_SUFFIXES)
     
     def build(self, file_path: Path) -> None:
         # Read the atlas JSON data.
         json_path = file_path
 
         try:
-            with json_path.open("r", encoding="utf-8") as f:
-                atlas_data = json.load(f)
+            atlas_data = self.load_atlas(json_path)
         except Exception as e:
             print(f"Error reading atlas JSON file {file_path}: {e}")
             return
 
+        if atlas_data.get("type") == "packed":
+            self.build_packed(file_path, atlas_data)
+        else:
+            self.build_single_image(file_path, atlas_data)
+
+    def build_single_image(self, file_path: Path, atlas_data: Dict) -> None:
         image_filename = atlas_data.get("image")
         
         if not image_filename:
@@ -107,21 +131,91 @@ class AtlasTool(AssetForge.AssetTool):
 
         # Open the image to determine its dimensions.
         try:
-            with Image.open(image_path) as img:
+            with self.open_dependency(image_path, "rb") as f, Image.open(f) as img:
                 img_width, img_height = img.size
         except Exception as e:
             print(f"Error opening image {image_path}: {e}")
             return
 
         entries = atlas_data.get("entries", [])
+        rects = [(entry.get("id", ""), entry.get("x", 0), entry.get("y", 0), entry.get("width", 0), entry.get("height", 0)) for entry in entries]
+
+        self.write_atlas_bin(file_path, rects, img_width, img_height)
+
+    def build_packed(self, file_path: Path, atlas_data: Dict) -> None:
+        folder = file_path.parent / Path(atlas_data.get("folder", "."))
+        padding = int(atlas_data.get("padding", 1))
+        max_size = int(atlas_data.get("max_size", 4096))
+        power_of_two = bool(atlas_data.get("power_of_two", True))
+
+        # Recording the folder rebuilds the atlas when sprites are added or removed.
+        self.record_dependency(folder)
+
+        sprites = {}
+        sprite_paths = {}
+        for sprite_path in self.sprite_files(folder):
+            sprite_id = sprite_path.relative_to(folder).with_suffix("").as_posix()
+            if sprite_id in sprite_paths:
+                # Ids leave out the suffix, so hero.png and hero.jpg would silently overwrite each other.
+                print(f"Error packing {file_path}: {sprite_paths[sprite_id]} and {sprite_path} both get the sprite id \"{sprite_id}\", rename one of them")
+                return
+            sprite_paths[sprite_id] = sprite_path
+            try:
+                with self.open_dependency(sprite_path, "rb") as f, Image.open(f) as img:
+                    sprites[sprite_id] = img.convert("RGBA")
+            except Exception as e:
+                print(f"Error opening sprite {sprite_path}: {e}")
+                return
+
+        sizes = {sprite_id: (img.width + padding, img.height + padding) for sprite_id, img in sprites.items()}
+
+        layout_file = self.output_folder / self.relative_path(file_path.with_suffix(".atlas.layout"))
+        settings = {"padding": padding, "max_size": max_size, "power_of_two": power_of_two}
+
+        previous = None
+        try:
+            with layout_file.open("r", encoding="utf-8") as f:
+                previous = json.load(f)
+            if previous.get("settings") != settings:
+                previous = None
+        except Exception:
+            previous = None
+
+        try:
+            if previous is not None:
+                bin_width, bin_height, slots = repack_rects(sizes, {k: tuple(v) for k, v in previous["slots"].items()}, (previous["width"], previous["height"]), max_size, power_of_two)
+            else:
+                bin_width, bin_height, positions = pack_rects(sizes, max_size, power_of_two)
+                slots = {k: (x, y) + sizes[k] for k, (x, y) in positions.items()}
+        except ValueError as e:
+            print(f"Error packing {file_path}: {e}")
+            return
+
+        sheet = Image.new("RGBA", (bin_width, bin_height), (0, 0, 0, 0))
+        for sprite_id, img in sprites.items():
+            sheet.paste(img, slots[sprite_id][:2])
+
+        rects = [(sprite_id, slots[sprite_id][0], slots[sprite_id][1], sprites[sprite_id].width, sprites[sprite_id].height) for sprite_id in sorted(sprites)]
+
+        sheet_file = self.output_folder / self.relative_path(file_path.with_suffix(".atlas.png"))
+        sheet_file.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            sheet.save(sheet_file)
+            with layout_file.open("w", encoding="utf-8") as f:
+                json.dump({"width": bin_width, "height": bin_height, "settings": settings, "slots": {k: list(v) for k, v in sorted(slots.items())}}, f, indent=4)
+            print(f"Packed {len(sprites)} sprites into {bin_width}x{bin_height} sheet {sheet_file}")
+        except Exception as e:
+            print(f"Error writing sheet {sheet_file}: {e}")
+            return
+
+        self.write_atlas_bin(file_path, rects, bin_width, bin_height)
+
+    def write_atlas_bin(self, file_path: Path, rects: List[Tuple[str, int, int, int, int]], img_width: int, img_height: int) -> None:
         uv_data = bytearray()
 
         # For each atlas entry, compute UV coordinates (as floats scaled to 0–1)
-        for entry in entries:
-            x = entry.get("x", 0)
-            y = entry.get("y", 0)
-            width = entry.get("width", 0)
-            height = entry.get("height", 0)
+        for _, x, y, width, height in rects:
             uv_min_x = x / img_width
             uv_min_y = y / img_height
             uv_max_x = (x + width) / img_width
@@ -130,12 +224,11 @@ class AtlasTool(AssetForge.AssetTool):
 
         # Build the text blob: each entry's id is null-terminated.
         text_blob = bytearray()
-        for entry in entries:
-            name = entry.get("id", "")
+        for name, *_ in rects:
             text_blob += name.encode("utf-8") + b'\0'
 
         text_blob_size = len(text_blob)
-        header = struct.pack("II", len(entries), text_blob_size)
+        header = struct.pack("II", len(rects), text_blob_size)
 
         output_bytes = header + uv_data + text_blob
 
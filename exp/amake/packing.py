@@ -0,0 +1,170 @@
+from typing import List, Dict, Tuple, Optional, Iterable
+
+Rect = Tuple[int, int, int, int]  # x, y, width, height
+
+class MaxRectsPacker:
+    """
+    MaxRects bin packer (Jukka Jylänki, "A Thousand Ways to Pack the Bin") using the
+    Best Short Side Fit heuristic. Rotation is not supported since atlas UVs are axis aligned.
+
+    The packer keeps a list of maximal free rectangles. Placing a rect splits every free rect
+    it overlaps into at most four maximal pieces, then the pieces contained in other free rects are pruned.
+    Only the new pieces need checking: the free rects that weren't split were maximal already, and a
+    piece can't contain one of them since the rect it was cut from didn't.
+    """
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.free_rects: List[Rect] = [(0, 0, width, height)]
+        self.used_rects: List[Rect] = []
+
+    def find_position(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        best = None
+        best_short = best_long = None
+
+        for fx, fy, fw, fh in self.free_rects:
+            if width <= fw and height <= fh:
+                leftover_x = fw - width
+                leftover_y = fh - height
+                short_side = min(leftover_x, leftover_y)
+                long_side = max(leftover_x, leftover_y)
+
+                if best is None or short_side < best_short or (short_side == best_short and long_side < best_long):
+                    best = (fx, fy)
+                    best_short = short_side
+                    best_long = long_side
+
+        return best
+
+    def insert(self, width: int, height: int) -> Optional[Tuple[int, int]]:
+        """Finds a spot for a width x height rect and occupies it. Returns None if it doesn't fit."""
+        pos = self.find_position(width, height)
+        if pos is not None:
+            self.place((pos[0], pos[1], width, height))
+        return pos
+
+    def place(self, rect: Rect) -> None:
+        """Marks an arbitrary rect as used, e.g. a slot kept from a previous packing."""
+        x, y, w, h = rect
+        kept: List[Rect] = []
+        pieces: List[Rect] = []
+
+        for free in self.free_rects:
+            fx, fy, fw, fh = free
+
+            if x >= fx + fw or x + w <= fx or y >= fy + fh or y + h <= fy:
+                kept.append(free)
+                continue
+
+            if x > fx:
+                pieces.append((fx, fy, x - fx, fh))
+            if x + w < fx + fw:
+                pieces.append((x + w, fy, fx + fw - (x + w), fh))
+            if y > fy:
+                pieces.append((fx, fy, fw, y - fy))
+            if y + h < fy + fh:
+                pieces.append((fx, y + h, fw, fy + fh - (y + h)))
+
+        self.free_rects = kept + _prune_pieces(pieces, kept)
+        self.used_rects.append(rect)
+
+def _contains(outer: Rect, inner: Rect) -> bool:
+    return inner[0] >= outer[0] and inner[1] >= outer[1] and inner[0] + inner[2] <= outer[0] + outer[2] and inner[1] + inner[3] <= outer[1] + outer[3]
+
+def _prune_pieces(pieces: List[Rect], kept: List[Rect]) -> List[Rect]:
+    """Drops the pieces contained in another piece or in one of the kept free rects, O(pieces * (pieces + kept))."""
+    pieces = list(dict.fromkeys(pieces))  # drop exact duplicates, keep order
+    pruned = []
+
+    for i, piece in enumerate(pieces):
+        if not any(i != j and _contains(other, piece) for j, other in enumerate(pieces)) and not any(_contains(free, piece) for free in kept):
+            pruned.append(piece)
+
+    return pruned
+
+def _next_power_of_two(n: int) -> int:
+    p = 1
+    while p < n:
+        p *= 2
+    return p
+
+def _candidate_sizes(sizes: Iterable[Tuple[int, int]], max_size: int, power_of_two: bool) -> List[Tuple[int, int]]:
+    sizes = list(sizes)
+    area = sum(w * h for w, h in sizes)
+    min_w = max((w for w, _ in sizes), default=1)
+    min_h = max((h for _, h in sizes), default=1)
+
+    side = 1
+    while side * side < area:
+        side *= 2
+
+    width = max(side, min_w)
+    height = max(side, min_h)
+
+    if power_of_two:
+        width = _next_power_of_two(width)
+        height = _next_power_of_two(height)
+
+    candidates = []
+    while width <= max_size and height <= max_size:
+        candidates.append((width, height))
+        # Grow the shorter side first so the bin stays close to square.
+        if width <= height:
+            width = width * 2 if power_of_two else width + max(1, width // 4)
+        else:
+            height = height * 2 if power_of_two else height + max(1, height // 4)
+
+    return candidates
+
+def pack_rects(sizes: Dict[str, Tuple[int, int]], max_size: int = 4096, power_of_two: bool = True) -> Tuple[int, int, Dict[str, Tuple[int, int]]]:
+    """
+    Packs named rects into the smallest bin it can find.
+    sizes : id -> (width, height), padding should already be included
+    return : (bin width, bin height, id -> (x, y))
+    """
+    order = sorted(sizes, key=lambda k: (max(sizes[k]), sizes[k][0] * sizes[k][1], k), reverse=True)
+
+    for width, height in _candidate_sizes(sizes.values(), max_size, power_of_two):
+        packer = MaxRectsPacker(width, height)
+        positions = {}
+
+        for key in order:
+            pos = packer.insert(*sizes[key])
+            if pos is None:
+                break
+            positions[key] = pos
+        else:
+            return width, height, positions
+
+    raise ValueError(f"Couldn't pack {len(sizes)} rects into a {max_size}x{max_size} bin")
+
+def repack_rects(sizes: Dict[str, Tuple[int, int]], previous: Dict[str, Rect], bin_size: Tuple[int, int], max_size: int = 4096, power_of_two: bool = True) -> Tuple[int, int, Dict[str, Rect]]:
+    """
+    Reuses a previous packing where possible. Every rect that still fits in its old slot keeps it,
+    rects that don't (or are new) are packed into the remaining free space. Falls back to a full
+    pack when that fails.
+    sizes : id -> (width, height) of the current rects
+    previous : id -> (x, y, slot width, slot height) from the last packing
+    bin_size : (width, height) of the last packing
+    return : (bin width, bin height, id -> (x, y, slot width, slot height))
+    """
+    width, height = bin_size
+    packer = MaxRectsPacker(width, height)
+    slots: Dict[str, Rect] = {}
+
+    for key, (w, h) in sizes.items():
+        slot = previous.get(key)
+        if slot is not None and w <= slot[2] and h <= slot[3] and slot[0] + slot[2] <= width and slot[1] + slot[3] <= height:
+            packer.place(slot)
+            slots[key] = slot
+
+    remaining = sorted((k for k in sizes if k not in slots), key=lambda k: (max(sizes[k]), sizes[k][0] * sizes[k][1], k), reverse=True)
+
+    for key in remaining:
+        pos = packer.insert(*sizes[key])
+        if pos is None:
+            width, height, positions = pack_rects(sizes, max_size, power_of_two)
+            return width, height, {k: (x, y) + sizes[k] for k, (x, y) in positions.items()}
+        slots[key] = (pos[0], pos[1]) + sizes[key]
+
+    return width, height, slots
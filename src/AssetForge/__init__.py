@@ -1,5 +1,16 @@
-from .core import AssetTool, RegisterTool, Build
+from .core import AssetTool, RegisterTool, Build, BuildCancelled
 from . import common
+from .events import JobEvent, EventSink, CallbackSink, JsonLinesSink, ProgressSink
 from .util import full_suffix, in_folder, add_suffix
 
-__all__ = ['AssetTool', 'RegisterTool', 'Build', 'common', 'full_suffix', 'in_folder', 'add_suffix']
\ No newline at end of file
+__all__ = ['AssetTool', 'RegisterTool', 'Build', 'BuildAsync', 'BuildCancelled', 'JobEvent', 'EventSink', 'CallbackSink', 'JsonLinesSink', 'ProgressSink', 'common', 'full_suffix', 'in_folder', 'add_suffix', 'Worker']
+
+def __getattr__(name):
+    # asyncio and the socket code are only loaded by the builds that use them, keeping `import AssetForge` cheap.
+    if name == "BuildAsync":
+        from .aio import BuildAsync
+        return BuildAsync
+    if name == "Worker":
+        from .distributed import Worker
+        return Worker
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
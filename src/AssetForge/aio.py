@@ -0,0 +1,72 @@
+"""
+asyncio front end for Build, for editors and hot reloading that can't block their event loop.
+
+Builds run on a single background thread: tools are shared through the AssetForge singleton and Build redirects
+sys.stdout while a job runs (other threads keep printing normally), so two builds can't safely run at the same time in one process. A build for the same
+input and output folders as a queued or running one supersedes it: the older one is cancelled after its current job
+and the newer one starts right after.
+"""
+from pathlib import Path
+from typing import Dict, Tuple, Optional, AsyncIterator
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .core import Build, BuildCancelled
+from .events import JobEvent, CallbackSink
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="AssetForge")
+_active: Dict[Tuple[str, str], threading.Event] = {} # target -> cancel event of its newest build
+
+async def BuildAsync(input_folder: Path, output_folder: Path, **kwargs) -> AsyncIterator[JobEvent]:
+    """
+    Runs Build(input_folder, output_folder, **kwargs) in the background and yields its JobEvents as they happen,
+    so outputs can be picked up (e.g. hot reloaded) as soon as their job is "finished" or "cached".
+
+        async for event in AssetForge.BuildAsync(Path("assets"), Path("build")):
+            if event.kind == "finished":
+                for output in event.outputs:
+                    reload(output)
+
+    Cancellation is cooperative, a running tool is never interrupted. Cancelling the task that iterates, or leaving
+    the loop early, stops the build after the job it's on. Being superseded by a newer BuildAsync of the same target
+    raises BuildCancelled from the loop, as does a build that was superseded before it got to start.
+    Jobs finished before a cancel are in the cache, so the next build picks up where this one stopped.
+    """
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Optional[JobEvent]]" = asyncio.Queue()
+    cancel = threading.Event()
+
+    target = (str(input_folder.resolve()), str(output_folder.resolve()))
+    if target in _active:
+        _active[target].set()
+    _active[target] = cancel
+
+    def forward(event: JobEvent) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    def run() -> None:
+        if cancel.is_set():
+            raise BuildCancelled(f"Build of {input_folder} was superseded before it started")
+        sinks = list(kwargs.pop("sinks", None) or []) + [CallbackSink(forward)]
+        Build(input_folder, output_folder, cancel=cancel, sinks=sinks, **kwargs)
+
+    future = loop.run_in_executor(_executor, run)
+    # Scheduled after every event forwarded by the build thread, so it always comes last.
+    future.add_done_callback(lambda _: events.put_nowait(None))
+
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+
+        await future # raises whatever Build raised
+    finally:
+        if not future.done():
+            cancel.set()
+            future.add_done_callback(lambda f: f.cancelled() or f.exception()) # nobody is left to await it
+        if _active.get(target) is cancel:
+            del _active[target]
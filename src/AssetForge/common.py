@@ -117,10 +117,58 @@ class CompressionTool(AssetTool):
         
         compressed_data = zlib.compress(data)
     
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
         # Write the compressed data to a file
         with open(output_path, "wb") as fout:
             fout.write(compressed_data)
 
+class MeshTool(AssetTool):
+    """
+    Turns `.obj` meshes into `.mesh.bin` files: vertices deduplicated into an index buffer, normals (when the
+    file has none) and tangents computed, triangles reordered for the vertex cache and vertices in the order
+    they're first used. The file is a small header followed by the interleaved vertex buffer and the index buffer,
+    see mesh.py for the C structs.
+
+    Needs numpy, which is only imported once a mesh is built (pip install AssetForge[mesh]).
+    compute_normals : ignore the normals in the file and compute smooth ones
+    optimize : reorder triangles for a vertex cache of cache_size entries (Tipsify)
+    """
+    def __init__(self, pattern=r"^.*\.obj$", compute_normals: bool = False, optimize: bool = True, cache_size: int = 16):
+        super().__init__()
+        self.pattern = pattern
+        self.compute_normals = compute_normals
+        self.optimize = optimize
+        self.cache_size = cache_size
+
+    def tool_name(self):
+        return "MeshTool"
+
+    def check_match(self, file_path: Path) -> bool:
+        return in_folder(file_path, self.input_folder) and bool(re.match(self.pattern, str(file_path), re.IGNORECASE))
+
+    def define_dependencies(self, file_path: Path) -> List[Path]:
+        return [] # materials (mtllib) aren't used
+
+    def define_outputs(self, file_path: Path) -> List[Path]:
+        return [self.output_folder / self.relative_path(file_path.with_suffix(".mesh.bin"))]
+
+    def build(self, file_path: Path) -> None:
+        try:
+            from . import mesh
+        except ImportError as e:
+            raise ImportError("MeshTool needs numpy; install it (pip install AssetForge[mesh])") from e
+
+        output_path = self.output_folder / self.relative_path(file_path.with_suffix(".mesh.bin"))
+
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f: # comments and material names can be in any encoding
+            vertices, indices = mesh.build_mesh(f.read(), self.compute_normals, self.optimize, self.cache_size)
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        mesh.write_mesh_bin(output_path, vertices, indices)
+
+        print(f"Mesh written to {output_path}: {len(vertices)} vertices, {len(indices) // 3} triangles")
+
 class IgnoreItToolDecorator(AssetTool):
     def __init__(self, tool : AssetTool, ignore_it_name : str):
         self.tool = tool
@@ -1,14 +1,23 @@
 from pathlib import Path
-from typing import List, Optional, Dict, Set, Callable, Any
-
-import uuid
+from typing import List, Optional, Dict, Set, Tuple
 
 import io
 import sys
 
 import threading
+import heapq
+import time
+import os
+
+from .util import viz_dependency_graph, subgraph_around, collapse_fan_outs, combine_hashes, Graph, Order, ThreadPool, FileHasher, FileRecord, deduplicate, release_shared
+from .graph import BuildGraph, PathTable, Job
+from .events import JobEvent, EventSink, ProgressSink
+
+_recording = threading.local() # files recorded by the job running on this thread
+
+class BuildCancelled(Exception):
+    """Raised by Build when its cancel event gets set. Jobs that finished before that are kept in the cache."""
 
-from .util import invert_graph, topological_sort, viz_dependency_graph, hash_file, combine_hashes, Graph, JobDict, ThreadPool
 
 class AssetTool:
     def __init__(self):
@@ -54,6 +63,22 @@ class AssetTool:
         """
         raise NotImplementedError("Subclasses should implement this.")
 
+    def record_dependency(self, file_path: Path) -> None:
+        """
+        Call from build() for every file it reads, so that changes to it rebuild this job even if define_dependencies didn't list it.
+        Recorded files are stored in the cache and checked on later builds; a recorded folder is checked by its list of files.
+        file_path : path to the file read, relative to the input folder like the other paths
+        """
+        recorded = getattr(_recording, "files", None)
+        if recorded is not None:
+            recorded.append(Path(file_path))
+
+    def open_dependency(self, file_path: Path, mode: str = "r", **kwargs):
+        """open() that records file_path with record_dependency when it's opened for reading."""
+        if not any(c in mode for c in "wax+"):
+            self.record_dependency(file_path)
+        return open(file_path, mode, **kwargs)
+
     def relative_path(self, file_path: Path) -> Path:
         if file_path.is_relative_to(self.input_folder):
             return file_path.relative_to(self.input_folder)
@@ -107,26 +132,44 @@ def _call_define_dependencies(tool, file_path):
     assert all(isinstance(item, Path) for item in tmp), f"{tool.tool_name()}'s define_dependencies didn't return a list with just Paths"
     return tmp
 
-def _call_build(forge, tool, file_path, quiet):
+def _call_recorded_build(tool, file_path) -> List[Path]:
+    """Runs tool.build and returns the files it recorded with record_dependency."""
+    _recording.files = []
+    try:
+        tool.build(file_path)
+        return _recording.files
+    finally:
+        _recording.files = None
+
+class _ThreadOutput:
+    """Stands in for sys.stdout/sys.stderr while a job runs: the job's thread writes to the log, other threads (say an editor's event loop) still print normally."""
+    def __init__(self, stream, log_buf):
+        self.stream = stream
+        self.log_buf = log_buf
+        self.thread = threading.get_ident()
+
+    def write(self, text):
+        return (self.log_buf if threading.get_ident() == self.thread else self.stream).write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def _call_build(forge, tool, file_path):
     old_stdout = sys.stdout
     old_stderr = sys.stderr
 
-    sys.stdout = forge.log_buf
-    sys.stderr = forge.log_buf
+    sys.stdout = _ThreadOutput(old_stdout, forge.log_buf)
+    sys.stderr = _ThreadOutput(old_stderr, forge.log_buf)
     try:
-        tool.build(file_path)
+        recorded = _call_recorded_build(tool, file_path)
     finally:
         sys.stdout = old_stdout
         sys.stderr = old_stderr
 
-    forge.done += 1
-    progress_str = (str(int(100 * forge.done / forge.todo)) + "%").ljust(4)
-    
-    if not quiet:
-        print(f"[{progress_str}] {tool.tool_name()} \"{file_path}\"")
+    return recorded
 
 def _call_build_parallel(forge, tool, file_path, quiet):
-    tool.build(file_path)
+    _call_recorded_build(tool, file_path)
 
     with forge.lock:
         forge.done += 1
@@ -136,22 +179,97 @@ def _call_build_parallel(forge, tool, file_path, quiet):
 def _pick_tools(tools : List[AssetTool], file_path : Path) -> List[AssetTool]:
     return [tool for tool in tools if __call_check_match(tool, file_path)]
 
-def _run_job(job_func: Callable[..., Any], *args, **kwargs) -> None:
-    return job_func(*args, **kwargs)
-
-def Build(input_folder: Path, output_folder: Path, recursive: bool = False, parallel: bool = False, debug: bool = False, quiet: bool = True):
-    if parallel:
-        print("Needs to be refactored for caching and logging")
-        parallel = False
-    
-    if not quiet:
-        print("[0%  ] building ... ")
-
-    assert isinstance(input_folder, Path), "input_folder is not a Path"
-    assert isinstance(output_folder, Path), "output_folder is not a Path"
-
-    forge = AssetForge()
+def _resolve_collisions(candidates: List[Tuple[AssetTool, Path, Set[Path]]], graph: BuildGraph) -> List[Tuple[AssetTool, Path, Set[Path]]]:
+    """
+    Drops candidate jobs until no two of them write the same file and none of them writes a file an earlier job already writes.
+    The lowest priority job among the colliding ones is dropped first, one at a time, like a min-heap over the colliding set:
+    dropping a job can only ever resolve collisions, so a job that stops colliding is never revisited.
+    """
+    claims: Dict[Path, int] = {}
+    for _, _, outs in candidates:
+        for o in outs:
+            claims[o] = claims.get(o, 0) + 1
+
+    def colliding(i):
+        return any(claims[o] > 1 or graph.is_output(o) for o in candidates[i][2])
+
+    heap = [(candidates[i][0].priority, i) for i in range(len(candidates)) if colliding(i)]
+    heapq.heapify(heap)
+
+    removed = set()
+    while heap:
+        _, i = heapq.heappop(heap)
+        if colliding(i):
+            removed.add(i)
+            for o in candidates[i][2]:
+                claims[o] -= 1
+
+    return [candidate for i, candidate in enumerate(candidates) if i not in removed]
+
+def _job_key(paths: PathTable, job: Job) -> str:
+    return f"{job.tool.tool_name()}|{','.join(paths[f] for f in job.inputs)}|{','.join(paths[f] for f in job.outputs)}"
+
+def _job_identity(paths: PathTable, job: Job) -> str:
+    """Like _job_key but without the dependencies, which are allowed to change with what the job records."""
+    return f"{job.tool.tool_name()}|{paths[job.file]}|{','.join(paths[f] for f in job.outputs)}"
+
+def _load_cache(cache_file: Path, hash_algorithm: str) -> Tuple[Dict[str, str], Dict[str, FileRecord], Dict[str, List[str]]]:
+    """
+    Reads cache.log, returns (job key -> combined hash, file -> record, job identity -> recorded dependencies).
+    Lines are <job key>=<hash>, @<file>=<digest>,<size>,<mtime_ns> and +<job identity>\t<file>\t<file>...
+    """
+    cached_jobs = {}
+    known_files = {}
+    recorded_dependencies = {}
 
+    try:
+        with open(cache_file, "r") as log_file:
+            for line in log_file:
+                line = line.strip()
+                if line.startswith("# hash="):
+                    if line[len("# hash="):] != hash_algorithm:
+                        break # hashed with something else, nothing in here can match
+                    continue
+                if not line or line.startswith("#"):
+                    continue
+
+                if line.startswith("+"):
+                    identity, *files = line[1:].split("\t")
+                    recorded_dependencies[identity] = files
+                    continue
+
+                key, _, value = line.rpartition("=")
+
+                if key.startswith("@"):
+                    # @<file>=<digest>,<size>,<mtime_ns> as of the end of the last build
+                    digest, size, mtime_ns = value.split(",")
+                    known_files[key[1:]] = (bytes.fromhex(digest), int(size), int(mtime_ns))
+                else:
+                    cached_jobs[key.strip()] = value.strip()
+    except Exception as e:
+        pass
+
+    return cached_jobs, known_files, recorded_dependencies
+
+def _save_cache(cache_file: Path, hash_algorithm: str, cached_jobs: Dict[str, str], known_files: Dict[str, FileRecord], recorded_dependencies: Dict[str, List[str]]) -> None:
+    with open(cache_file, "w") as log_file:
+        log_file.write(f"# hash={hash_algorithm}\n")
+        for job, hash in cached_jobs.items():
+            log_file.write(f"{job}={hash}\n")
+        for file, (digest, size, mtime_ns) in known_files.items():
+            log_file.write(f"@{file}={digest.hex()},{size},{mtime_ns}\n")
+        for identity, files in recorded_dependencies.items():
+            if files:
+                log_file.write("+" + "\t".join([identity] + files) + "\n")
+
+def _plan_build(forge: AssetForge, input_folder: Path, output_folder: Path, debug: bool = False, debug_format: str = "svg", recorded_dependencies: Optional[Dict[str, List[str]]] = None) -> BuildGraph:
+    """
+    Planning phase of Build: starts every tool, matches tools to files until no new outputs show up,
+    and returns the bipartite file/job dependency graph.
+
+    recorded_dependencies : what jobs recorded during the last build; the ones that are built by other jobs
+                            order the job after them (Job.after), they stay out of job.inputs and so out of the cache key
+    """
     for tool in forge.get_tools():
         # tool.input_folder = input_folder
         # tool.output_folder = output_folder
@@ -164,98 +282,131 @@ def Build(input_folder: Path, output_folder: Path, recursive: bool = False, para
             root_files.add(file)
 
     if debug:
-        root_files.add(input_folder / Path("output.svg"))
+        root_files.add(input_folder / Path(f"output.{debug_format}"))
         root_files.add(input_folder / Path("output.log"))
     
     delta = root_files
-    output_files = set()
 
-    graph: Graph = {}
-    jobs: JobDict = {}
+    graph = BuildGraph()
 
-    for file in root_files:
-        graph[str(file)] = set()
+    for file in sorted(root_files):
+        graph.add_file(file)
 
     while len(delta) > 0:
 
         staged_files = set()
 
-        matched_tools = []
-        output_sets = []
-        input_files = []
+        candidates = []
 
         for file in delta:
             tools = _pick_tools(forge.get_tools(), file)
             for tool in tools:
                 outs = _call_define_outputs(tool, file)
-                
-                matched_tools.append(tool)
-                output_sets.append(set(outs))
-                input_files.append(file)
-        
-        while True:
-            collisions = set()
-
-            for i in range(len(output_sets)):
-                for j in range(i + 1, len(output_sets)):
-                    if output_sets[i] & output_sets[j]:
-                        collisions.add(i)
-                        collisions.add(j)
-                
-                if output_sets[i] & output_files:
-                    collisions.add(i)
-            
-            if len(collisions) == 0:
-                break
-
-            to_remove = min(collisions, key = lambda i : matched_tools[i].priority)
-
-            output_sets.pop(to_remove)
-            matched_tools.pop(to_remove)
-            input_files.pop(to_remove)
+                candidates.append((tool, file, set(outs)))
         
-        for i, (tool, outs, file) in enumerate(zip(matched_tools, output_sets, input_files)):
+        for tool, file, outs in _resolve_collisions(candidates, graph):
             deps = _call_define_dependencies(tool, file)
 
             staged_files |= outs
-            tool_id = f"{tool.tool_name()}_{uuid.uuid4().hex}"
-
-            graph[tool_id] = set([str(d) for d in deps]) | set([str(file)])
-            jobs[tool_id] = (_call_build_parallel if parallel else _call_build, forge, tool, file, quiet)
-
-            for o in outs:
-                graph[str(o)] = set([tool_id])
+            graph.add_job(tool, file, deps, sorted(outs))
     
-        output_files |= staged_files
         delta = staged_files
 
-    bipartite_order = topological_sort(graph)
-    order = bipartite_order[1::2]
+    if recorded_dependencies:
+        for job in graph.jobs:
+            generated = [d for d in recorded_dependencies.get(_job_identity(graph.paths, job), []) if graph.is_output(d) and graph.producer[graph.paths.get(d)] != job.id]
+            if generated:
+                graph.add_order(job, generated)
 
-    if debug:
-        bipartite_order_copy = bipartite_order.copy()
-        graph_copy = graph.copy()
+    graph.freeze()
 
-        whitelist = set()
-        
-        for tool in bipartite_order_copy[1]:
+    return graph
+
+def _write_debug_graph(graph: Graph, bipartite_order: Order, input_folder: Path, debug_format: str, debug_focus: Optional[Path], debug_radius: int, debug_collapse: int) -> None:
+    bipartite_order_copy = [set(nodes) for nodes in bipartite_order]
+    graph_copy = graph.copy()
+
+    whitelist = set()
+    
+    for tools in bipartite_order_copy[1::2]:
+        for tool in tools:
             whitelist |= graph[tool]
-        
-        blacklist = set()
-        
-        for file in graph_copy.keys():
-            if file not in whitelist and file in bipartite_order_copy[0]:
-                blacklist.add(file)
+    
+    blacklist = set()
+    
+    for file in graph_copy.keys():
+        if file not in whitelist and file in bipartite_order_copy[0]:
+            blacklist.add(file)
+
+    for file in blacklist:
+        bipartite_order_copy[0].remove(file)
+        graph_copy.pop(file)
+
+    if debug_focus is not None:
+        if str(debug_focus) in graph_copy:
+            graph_copy, bipartite_order_copy = subgraph_around(graph_copy, bipartite_order_copy, str(debug_focus), debug_radius)
+        else:
+            print(f"debug_focus {debug_focus} isn't in the build graph, writing the whole graph")
+
+    if debug_collapse > 0:
+        graph_copy, bipartite_order_copy = collapse_fan_outs(graph_copy, bipartite_order_copy, debug_collapse)
+
+    viz_dependency_graph(graph_copy, bipartite_order_copy, input_folder / Path("output"), debug_format)
+
+def Build(input_folder: Path, output_folder: Path, recursive: bool = False, parallel: bool = False, debug: bool = False, quiet: bool = True,
+          debug_format: str = "svg", debug_focus: Optional[Path] = None, debug_radius: int = 2, debug_collapse: int = 0,
+          hash_algorithm: str = "sha256", hash_threads: Optional[int] = None,
+          workers: Optional[str] = None, wait_for_workers: float = 0.0, ship_outputs: bool = False, job_timeout: Optional[float] = None, worker_secret: Optional[str] = None,
+          cancel: Optional[threading.Event] = None, sinks: Optional[List[EventSink]] = None, dedup: Optional[str] = None):
+    """
+    Builds every output that can be made from the files in input_folder with the registered tools.
+
+    hash_algorithm : how files are hashed for the cache, any hashlib algorithm or "xxh3"/"xxh64"/"xxh128" if xxhash is installed.
+                     "xxh3" is a lot faster for a local cache and "blake2b" beats "sha256" on cpus without SHA extensions;
+                     keep "sha256" for caches shared between machines.
+    hash_threads : threads used to hash files, defaults to the number of cpus
+
+    workers : "host:port" or "unix:/path.sock" to listen on for Worker processes, jobs that need to run are sent to them (see distributed.py)
+    wait_for_workers : seconds to wait for the first worker before building; jobs run locally whenever no worker is connected
+    ship_outputs : have workers send their outputs back instead of relying on a shared output folder
+    job_timeout : seconds a worker gets per job before it's considered dead and its job is given to another one
+    worker_secret : shared with the workers (Worker(secret=...)), defaults to the ASSETFORGE_SECRET environment variable; required over TCP
+
+    cancel : checked between jobs, once it's set the build stops, saves the cache and raises BuildCancelled
+    sinks : EventSinks (see events.py) that get a JobEvent from the building thread when a job starts, finishes, fails or is found up to date;
+            quiet=False adds a ProgressSink
+
+    dedup : "hardlink" or "store" to make identical outputs share their storage after the build, either as hardlinks to one of them
+            or as symlinks into output_folder/.store (see util.deduplicate); the bytes saved are printed unless quiet
+
+    debug : writes the dependency graph to input_folder/output.<debug_format> and the tools' output to input_folder/output.log
+    debug_format : "svg" (or any other graphviz format) renders with graphviz, "dot" and "json" are plain dumps that don't need it
+    debug_focus : only write the part of the graph within debug_radius edges of this file
+    debug_collapse : merge groups of more than this many similar nodes (e.g. 1000 LinkingTool jobs) into one node, 0 disables it
+    """
+    if parallel:
+        print("Needs to be refactored for caching and logging")
+        parallel = False
+    
+    assert isinstance(input_folder, Path), "input_folder is not a Path"
+    assert isinstance(output_folder, Path), "output_folder is not a Path"
+
+    forge = AssetForge()
+
+    cache_file = input_folder / Path("cache.log")
+    cached_jobs, known_files, recorded_dependencies = _load_cache(cache_file, hash_algorithm)
 
-        for file in blacklist:
-            bipartite_order_copy[0].remove(file)
-            graph_copy.pop(file)
+    graph = _plan_build(forge, input_folder, output_folder, debug, debug_format, recorded_dependencies)
 
-        viz_dependency_graph(graph_copy, bipartite_order_copy, input_folder / Path("output"))
+    order = graph.job_levels()
 
-    inv_graph = invert_graph(graph)
+    if debug:
+        _write_debug_graph(*graph.to_dict(order), input_folder, debug_format, debug_focus, debug_radius, debug_collapse)
+        (input_folder / Path("output.log")).touch() # jobs may read it before it's written at the end of the build
 
-    forge.todo = sum([len(b) for b in order])
+    forge.todo = len(graph.jobs)
+    forge.done = 0
+    cancelled = False
 
     if parallel:
         forge.lock = threading.Lock()
@@ -269,8 +420,9 @@ def Build(input_folder: Path, output_folder: Path, recursive: bool = False, para
             sys.stdout = forge.log_buf
             sys.stderr = forge.log_buf
 
-            for node in batch:
-                thread_pool.submit_job(*jobs[node])
+            for job_id in batch:
+                job = graph.jobs[job_id]
+                thread_pool.submit_job(_call_build_parallel, forge, job.tool, graph.paths.path(job.file), quiet)
             
             thread_pool.wait_for_all_jobs()
 
@@ -289,36 +441,136 @@ def Build(input_folder: Path, output_folder: Path, recursive: bool = False, para
         sys.stderr = old_stderr
     else:
 
-        cached_jobs = {}
+        paths = graph.paths
+        store_folder = output_folder / Path(".store")
+        try:
+            cache_time = os.stat(cache_file).st_mtime_ns # same clock and granularity as the files' mtimes
+        except OSError:
+            cache_time = None
+        hasher = FileHasher(hash_algorithm, hash_threads, known_files, cache_time)
+        finished = bytearray(len(graph.jobs))
+        cutoffs = 0
+
+        def checked_files(job: Job) -> List[str]:
+            # declared inputs and outputs, plus whatever the job recorded reading last time
+            return list(dict.fromkeys([paths[f] for f in job.inputs + job.outputs] + recorded_dependencies.get(_job_identity(paths, job), [])))
+
+        def read_files(job: Job) -> List[str]:
+            outputs = set(paths[f] for f in job.outputs)
+            return [f for f in checked_files(job) if f not in outputs]
+
+        sinks = list(sinks) if sinks is not None else []
+        if not quiet:
+            sinks.append(ProgressSink())
+
+        def emit(kind: str, job: Job, duration: float = 0.0, error: str = "") -> None:
+            if not sinks:
+                return # nobody's listening, skip building the event
+            written = sum(hasher.size(paths[f]) for f in job.outputs) if kind in ("finished", "cached") else 0
+            event = JobEvent(kind, job.tool.tool_name(), paths.path(job.file), [paths.path(f) for f in job.outputs], forge.done, forge.todo,
+                             duration, sum(hasher.size(paths[f]) for f in job.inputs), written, error)
+            for sink in sinks:
+                sink.emit(event)
+
+        coordinator = None
+        if workers is not None:
+            from .distributed import Coordinator
+            coordinator = Coordinator(workers, input_folder, output_folder, hash_algorithm, ship_outputs, job_timeout, worker_secret)
+            coordinator.wait_for_workers(1, wait_for_workers)
+
+        def run_jobs(jobs: List[Job]):
+            # yields (job, recorded dependencies, seconds it took)
+            if coordinator is not None:
+                yield from coordinator.run_jobs(forge, graph, hasher, jobs, emit, read_files)
+                return
+            for job in jobs:
+                emit("started", job)
+                start = time.perf_counter()
+                try:
+                    recorded = _call_build(forge, job.tool, paths.path(job.file))
+                except Exception as e:
+                    emit("failed", job, time.perf_counter() - start, repr(e))
+                    raise
+                yield job, recorded, time.perf_counter() - start
 
         try:
-            with open(input_folder / Path("cache.log"), "r") as log_file:
-                for line in log_file:
-                    line = line.strip()
-                    if not line or line.startswith("#"):
-                        continue
+            for batch in order:
+                if cancel is not None and cancel.is_set():
+                    raise BuildCancelled()
 
-                    key, _, value = line.partition("=")
-                    cached_jobs[key.strip()] = value.strip()
-        except Exception as e:
-            pass
+                # Everything this batch reads was finished by earlier batches, so hash it all up front in parallel.
+                hasher.prefetch(f for job_id in batch for f in checked_files(graph.jobs[job_id]))
 
-        for batch in order:
-            for node in batch:
-                ckey = f"{node[:-33]}|{','.join(graph[node])}|{','.join(inv_graph[node])}"
-                if ckey in cached_jobs and cached_jobs[ckey] == combine_hashes([hash_file(Path(f)) for f in graph[node]] + [hash_file(Path(f)) for f in inv_graph[node]]):
-                    if not quiet:
+                stale = []
+
+                for job_id in batch:
+                    job = graph.jobs[job_id]
+                    ckey = _job_key(paths, job)
+
+                    try:
+                        up_to_date = ckey in cached_jobs and cached_jobs[ckey] == combine_hashes([hasher.digest(f) for f in checked_files(job)], hash_algorithm)
+                    except OSError:
+                        up_to_date = False # a recorded dependency is gone
+
+                    if up_to_date:
+                        finished[job_id] = 1
                         forge.done += 1
-                        progress_str = (str(int(100 * forge.done / forge.todo)) + "%").ljust(4)
-    
-                        print(f"[{progress_str}] {node[:-33]} c\"{jobs[node][3]}\"")
-                else:    
-                    _run_job(*jobs[node])
-                    cached_jobs[ckey] = combine_hashes([hash_file(Path(f)) for f in graph[node]] + [hash_file(Path(f)) for f in inv_graph[node]])
+                        emit("cached", job)
+                    else:
+                        stale.append(job)
+
+                # Outputs deduplicated by an earlier build share their bytes with other files, a tool writing into one would change them all.
+                release_shared((paths[f] for job in stale for f in job.outputs), store_folder)
+
+                # Jobs in a batch don't depend on each other, so they can run in any order (or anywhere).
+                for job, recorded, duration in run_jobs(stale):
+                    hasher.invalidate(paths[f] for f in job.outputs)
+
+                    declared = set(paths[f] for f in job.inputs + job.outputs)
+                    # job.inputs only holds what define_dependencies returned, files the job is ordered after still need recording
+                    # to keep that order. Another job's output is kept even if it doesn't exist yet, it was read too early.
+                    dependencies = [d for d in dict.fromkeys(str(r) for r in recorded) if d not in declared and (os.path.exists(d) or graph.is_output(d))]
+
+                    for d in dependencies:
+                        producer = graph.producer[graph.paths.get(d)] if graph.is_output(d) else -1
+                        if producer >= 0 and not finished[producer]:
+                            print(f"{job.tool.tool_name()} read \"{d}\" before it was built; it will wait for it from the next build on")
+
+                    recorded_dependencies[_job_identity(paths, job)] = dependencies
+                    try:
+                        cached_jobs[_job_key(paths, job)] = combine_hashes([hasher.digest(f) for f in checked_files(job)], hash_algorithm)
+                    except OSError:
+                        cached_jobs.pop(_job_key(paths, job), None) # it read an output that isn't built yet, run it again next time
+
+                    # Early cutoff: if the job wrote exactly what it wrote last time, the keys of everything
+                    # downstream still match and those jobs are skipped without running.
+                    if all(hasher.digest(paths[f]) == hasher.previous(paths[f]) for f in job.outputs) and any(len(graph.consumers_of(f)) for f in job.outputs):
+                        cutoffs += 1
+
+                    finished[job.id] = 1
+                    forge.done += 1
+                    emit("finished", job, duration)
+
+                    if cancel is not None and cancel.is_set():
+                        raise BuildCancelled()
+        except BuildCancelled:
+            cancelled = True # stop here, but keep what's been built so far in the cache
+        finally:
+            hasher.close()
+            if coordinator is not None:
+                coordinator.close()
+            for sink in sinks:
+                sink.close()
         
-        with open(input_folder / Path("cache.log"), "w") as log_file:
-            for job, hash in cached_jobs.items():
-                log_file.write(f"{job}={hash}\n")
+        if not quiet and cutoffs > 0:
+            print(f"{cutoffs} rebuilt job(s) wrote identical outputs, so their dependents were kept")
+
+        if dedup is not None and not cancelled:
+            linked, saved = deduplicate((paths[f] for job in graph.jobs for f in job.outputs), hasher, dedup, store_folder)
+            if not quiet:
+                print(f"dedup: {linked} output(s) newly linked, identical outputs now save {saved / (1 << 20):.1f} MiB")
+
+        _save_cache(cache_file, hash_algorithm, cached_jobs, hasher.records(), recorded_dependencies)
 
     if debug:
         with open(input_folder / Path("output.log"), "w") as log_file:
@@ -327,4 +579,7 @@ def Build(input_folder: Path, output_folder: Path, recursive: bool = False, para
     forge.log_buf.truncate(0)
     forge.log_buf.seek(0)
 
+    if cancelled:
+        raise BuildCancelled(f"Build of {input_folder} was cancelled after {forge.done} of {forge.todo} jobs")
+
     # print("[100%] done")
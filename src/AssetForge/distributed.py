@@ -0,0 +1,475 @@
+"""
+Coordinator/worker mode for Build.
+
+Build(..., workers="build-server:5555") listens for workers and sends them the jobs that need to run. A worker is the same
+Amake.py started with Worker("build-server:5555") instead of Build, from the same working directory, so it has the
+same tools registered and sees the same files (a shared folder or a checkout on each machine).
+
+Both sides prove they know a shared secret (Build's worker_secret, Worker's secret or the ASSETFORGE_SECRET environment
+variable) before any job is sent, it's required over TCP. A Unix socket can go without one, it's only accessible to its owner.
+The connection itself isn't encrypted, use a tunnel (e.g. ssh -L) across networks that aren't trusted.
+
+Messages are JSON objects sent as a 4 byte big endian length followed by the utf-8 text:
+    coordinator -> worker       {"type": "challenge", "nonce": hex}
+    worker      -> coordinator  {"type": "hello", "tools": [tool names in registration order], "nonce": hex, "proof": hex}
+    coordinator -> worker       {"type": "start", "input_folder": ..., "output_folder": ..., "hash_algorithm": ..., "ship_outputs": bool, "proof": hex}
+    coordinator -> worker       {"type": "job", "id": ..., "tool": tool index, "file": ..., "inputs": {file: hex digest}, "outputs": [...]}
+    worker      -> coordinator  {"type": "result", "id": ..., "status": "ok" | "stale" | "error", "log": ..., "recorded": [...], "duration": seconds,
+                                 "recorded_digests": {file: hex digest},
+                                 "error": ..., "outputs": {file: {"data": base64} | {"link": target}}}
+"inputs" holds the files the job reads: its declared inputs and the files it recorded last build. A worker answers
+"stale" when its copy of one of them doesn't match the digest the coordinator sent, and the coordinator runs that job
+itself; it does the same when a file the worker recorded this time differs from its own copy.
+"proof" is the HMAC-SHA256 of "worker|<coordinator nonce>|<worker nonce>" (hello) or "coordinator|<worker nonce>|<coordinator nonce>"
+(start) keyed with the secret. Workers refuse jobs whose file or outputs are outside the input and output folders they were started with.
+Jobs of a worker that disconnects are handed to the other workers.
+"""
+from pathlib import Path
+from typing import List, Dict, Tuple, Optional, Iterator, Any, Union
+
+import io
+import os
+import sys
+import hmac
+import json
+import time
+import queue
+import base64
+import socket
+import hashlib
+import struct
+import threading
+import traceback
+
+from .core import AssetForge, _call_build, _call_recorded_build
+from .graph import Job
+from .util import hash_file
+
+def _parse_address(address: str) -> Tuple[int, Any]:
+    """"unix:/path/to.sock" for a Unix socket, "host:port" for TCP."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+
+    host, _, port = address.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+def _secret(secret: Optional[Union[str, bytes]], family: int) -> bytes:
+    if secret is None:
+        secret = os.environ.get("ASSETFORGE_SECRET")
+    if secret is None:
+        if family == socket.AF_UNIX:
+            return b""
+        raise ValueError("Workers over TCP need a shared secret: pass Build(worker_secret=...) and Worker(secret=...), or set ASSETFORGE_SECRET")
+    return secret.encode("utf-8") if isinstance(secret, str) else secret
+
+def _proof(secret: bytes, role: str, *nonces: str) -> str:
+    return hmac.new(secret, "|".join((role,) + nonces).encode("utf-8"), hashlib.sha256).hexdigest()
+
+def _inside(file: str, folders: List[str]) -> bool:
+    """True if file is in one of folders (real paths). Its folder is resolved, the file itself may be a link to anywhere."""
+    path = os.path.join(os.path.realpath(os.path.dirname(os.path.abspath(file))), os.path.basename(file))
+    return any(path.startswith(folder + os.sep) for folder in folders)
+
+def _send(sock: socket.socket, message: Dict) -> None:
+    data = json.dumps(message).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def _recv(sock: socket.socket) -> Optional[Dict]:
+    """Returns the next message, or None if the other side closed the connection."""
+    header = _recv_exactly(sock, 4)
+    if header is None:
+        return None
+    data = _recv_exactly(sock, struct.unpack(">I", header)[0])
+    if data is None:
+        return None
+    return json.loads(data.decode("utf-8"))
+
+class Coordinator:
+    """
+    Accepts worker connections and runs batches of jobs on them, each worker runs one job at a time.
+    Every worker gets a thread that takes jobs off a shared queue, so a job left behind by a worker that died
+    is put back on the queue for the others, and when no workers are left the coordinator runs the rest itself.
+    """
+    def __init__(self, address: str, input_folder: Path, output_folder: Path, hash_algorithm: str = "sha256", ship_outputs: bool = False, job_timeout: Optional[float] = None,
+                 secret: Optional[Union[str, bytes]] = None):
+        family, addr = _parse_address(address)
+        self.secret = _secret(secret, family)
+        self.input_folder = input_folder
+        self.output_folder = output_folder
+        self.hash_algorithm = hash_algorithm
+        self.ship_outputs = ship_outputs
+        self.job_timeout = job_timeout
+        self.tool_names = [tool.tool_name() for tool in AssetForge().get_tools()]
+
+        self.pending: "queue.Queue[Tuple[Job, Dict]]" = queue.Queue()
+        self.results: "queue.Queue[Tuple[Job, Optional[Dict]]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.alive = 0
+        self._closed = False
+
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.remove(addr)
+
+        self.server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(addr)
+        if family == socket.AF_UNIX:
+            os.chmod(addr, 0o600)
+        self.server.listen()
+
+        bound = self.server.getsockname()
+        self.address = f"unix:{bound}" if family == socket.AF_UNIX else f"{bound[0]}:{bound[1]}"
+
+        self.accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self.accept_thread.start()
+
+    def _accept(self) -> None:
+        while not self._closed:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return # closed
+
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        """Handshake with one worker, then feed it jobs until it or the coordinator goes away."""
+        try:
+            conn.settimeout(10.0) # a connection that doesn't answer the challenge isn't a worker
+            nonce = os.urandom(16).hex()
+            _send(conn, {"type": "challenge", "nonce": nonce})
+
+            hello = _recv(conn)
+            if hello is None or hello.get("type") != "hello" or not isinstance(hello.get("nonce"), str) or \
+               not hmac.compare_digest(str(hello.get("proof")).encode("utf-8"), _proof(self.secret, "worker", nonce, hello["nonce"]).encode("utf-8")):
+                print("Rejected a worker that doesn't know the secret")
+                conn.close()
+                return
+            if hello.get("tools") != self.tool_names:
+                print(f"Rejected a worker with different tools registered: {hello.get('tools')}")
+                conn.close()
+                return
+
+            _send(conn, {"type": "start", "input_folder": str(self.input_folder), "output_folder": str(self.output_folder),
+                         "hash_algorithm": self.hash_algorithm, "ship_outputs": self.ship_outputs,
+                         "proof": _proof(self.secret, "coordinator", hello["nonce"], nonce)})
+        except (OSError, ValueError):
+            conn.close()
+            return
+
+        conn.settimeout(self.job_timeout)
+
+        with self.lock:
+            self.alive += 1
+
+        job = None
+        try:
+            while True:
+                job, message = self.pending.get()
+                if job is None:
+                    _send(conn, {"type": "bye"})
+                    return
+
+                _send(conn, message)
+                reply = _recv(conn)
+                if reply is None:
+                    raise ConnectionError("worker disconnected")
+
+                self.results.put((job, reply))
+                job = None
+        except (OSError, ValueError, ConnectionError):
+            if job is not None:
+                self.pending.put((job, message)) # let someone else run it
+        finally:
+            with self.lock:
+                self.alive -= 1
+            conn.close()
+
+    def wait_for_workers(self, count: int, timeout: float) -> int:
+        """Waits until count workers are connected or timeout seconds pass, returns how many are connected."""
+        deadline = time.monotonic() + timeout
+        while self.alive < count and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.alive
+
+    def run(self, jobs: List[Job], messages: List[Dict], run_locally) -> Iterator[Tuple[Job, Optional[Dict]]]:
+        """
+        Runs jobs on the workers and yields (job, result message) as they finish.
+        run_locally(job) is used for jobs no worker could take, they are yielded with a None result.
+        """
+        for job, message in zip(jobs, messages):
+            self.pending.put((job, message))
+
+        remaining = len(jobs)
+        while remaining > 0:
+            try:
+                job, reply = self.results.get(timeout=0.1)
+            except queue.Empty:
+                if self.alive == 0:
+                    # Nobody is left to take the queued jobs (or nobody ever came), run them here.
+                    while True:
+                        try:
+                            job, _ = self.pending.get_nowait()
+                        except queue.Empty:
+                            break
+                        run_locally(job)
+                        remaining -= 1
+                        yield job, None
+                continue
+
+            remaining -= 1
+            yield job, reply
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self.pending.get_nowait() # jobs left over from a cancelled build
+            except queue.Empty:
+                break
+        for _ in range(self.alive):
+            self.pending.put((None, None))
+        try:
+            self.server.shutdown(socket.SHUT_RDWR) # wakes up accept(), close() alone leaves the port listening until it returns
+        except OSError:
+            pass
+        try:
+            self.server.close()
+        except OSError:
+            pass
+        self.accept_thread.join()
+        if self.server.family == socket.AF_UNIX:
+            try:
+                os.remove(self.address[len("unix:"):])
+            except OSError:
+                pass
+
+    def job_message(self, job: Job, paths, digests: Dict[str, bytes]) -> Dict:
+        return {
+            "type": "job",
+            "id": job.id,
+            "tool": AssetForge().get_tools().index(job.tool),
+            "file": paths[job.file],
+            "inputs": {f: d.hex() for f, d in digests.items()},
+            "outputs": [paths[f] for f in job.outputs],
+        }
+
+    def run_jobs(self, forge: AssetForge, graph, hasher, jobs: List[Job], emit, read_files) -> Iterator[Tuple[Job, List[Path], float]]:
+        """
+        Build's hook: runs jobs on the workers and yields (job, recorded dependencies, seconds it took) like running them locally would.
+        "started" is emitted when a job is handed to the workers, the duration is the one measured by the worker.
+        read_files(job) : the files the job reads, its inputs and what it recorded last time; the worker checks its copies against them
+        """
+        paths = graph.paths
+        local: Dict[int, Tuple[List[Path], float]] = {}
+        messages: Dict[int, Dict] = {}
+
+        def build_here(job):
+            start = time.perf_counter()
+            try:
+                recorded = _call_build(forge, job.tool, paths.path(job.file))
+            except Exception as e:
+                emit("failed", job, time.perf_counter() - start, repr(e))
+                raise
+            return recorded, time.perf_counter() - start
+
+        def run_locally(job):
+            local[job.id] = build_here(job)
+
+        def same_as_here(digests: Dict[str, str]) -> bool:
+            try:
+                return all(hasher.digest(f).hex() == d for f, d in digests.items())
+            except OSError:
+                return False
+
+        for job in jobs:
+            digests = {}
+            for f in read_files(job):
+                try:
+                    digests[f] = hasher.digest(f)
+                except OSError:
+                    pass # the tool will complain about it on the worker
+            messages[job.id] = self.job_message(job, paths, digests)
+            emit("started", job)
+
+        for job, reply in self.run(jobs, [messages[job.id] for job in jobs], run_locally):
+            if reply is None:
+                yield (job,) + local.pop(job.id)
+                continue
+
+            if reply["status"] == "stale" or (reply["status"] == "ok" and not same_as_here(reply["recorded_digests"])):
+                # The worker read different files than we have, build it here.
+                yield (job,) + build_here(job)
+                continue
+
+            forge.log_buf.write(reply["log"])
+
+            if reply["status"] == "error":
+                emit("failed", job, reply["duration"], reply["error"].strip().splitlines()[-1])
+                raise RuntimeError(f"{job.tool.tool_name()} failed on a worker building \"{paths[job.file]}\":\n{reply['error']}")
+
+            self.store_outputs(reply, messages[job.id]["outputs"])
+
+            yield job, [Path(r) for r in reply["recorded"]], reply["duration"]
+
+    def store_outputs(self, reply: Dict, outputs: List[str]) -> None:
+        """
+        Writes the outputs a worker shipped back. Only the job's own outputs are written, and links only
+        to files in the input or output folder, so a broken or hostile worker can't write anywhere else.
+        """
+        folders = [os.path.realpath(self.input_folder), os.path.realpath(self.output_folder)]
+
+        for file, content in reply.get("outputs", {}).items():
+            if file not in outputs or not _inside(file, folders):
+                raise RuntimeError(f"A worker sent \"{file}\", which isn't an output of its job")
+
+            path = Path(file)
+
+            if "link" in content:
+                target = os.path.realpath(os.path.join(path.parent, content["link"]))
+                if not any(target == f or target.startswith(f + os.sep) for f in folders):
+                    raise RuntimeError(f"A worker sent \"{file}\" as a link to \"{content['link']}\", which is outside the input and output folders")
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+            if path.is_symlink() or path.exists():
+                os.remove(path)
+
+            if "link" in content:
+                path.symlink_to(content["link"])
+            else:
+                path.write_bytes(base64.b64decode(content["data"]))
+
+def _run_worker_job(tools, message: Dict, hash_algorithm: str, ship_outputs: bool, folders: List[str]) -> Dict:
+    reply = {"type": "result", "id": message["id"], "status": "ok", "log": "", "recorded": [], "duration": 0.0}
+
+    # Only read and ship files of the folders this worker was started with, whatever the coordinator asks for.
+    outside = [f for f in [message["file"], *message["outputs"]] if not _inside(f, folders)]
+    if outside:
+        reply["status"] = "error"
+        reply["error"] = f"Refused a job with paths outside the input and output folders: {outside}"
+        return reply
+
+    for file, digest in message["inputs"].items():
+        try:
+            same = hash_file(file, hash_algorithm).hex() == digest
+        except OSError:
+            same = False
+        if not same:
+            reply["status"] = "stale"
+            return reply
+
+    tool = tools[message["tool"]]
+    log_buf = io.StringIO()
+
+    old_stdout = sys.stdout
+    old_stderr = sys.stderr
+    sys.stdout = log_buf
+    sys.stderr = log_buf
+    start = time.perf_counter()
+    try:
+        reply["recorded"] = [str(p) for p in _call_recorded_build(tool, Path(message["file"]))]
+    except Exception:
+        reply["status"] = "error"
+        reply["error"] = traceback.format_exc()
+    finally:
+        sys.stdout = old_stdout
+        sys.stderr = old_stderr
+    reply["duration"] = time.perf_counter() - start
+
+    # What the tool actually read, so the coordinator can check it has the same files.
+    reply["recorded_digests"] = {}
+    for file in reply["recorded"]:
+        try:
+            reply["recorded_digests"][file] = hash_file(file, hash_algorithm).hex()
+        except OSError:
+            pass
+
+    reply["log"] = log_buf.getvalue()
+
+    if ship_outputs and reply["status"] == "ok":
+        outputs = {}
+        for file in message["outputs"]:
+            path = Path(file)
+            if path.is_symlink():
+                target = os.readlink(path)
+                if os.path.isabs(target) and _inside(os.path.realpath(path), folders):
+                    # A link into this worker's folders, e.g. from LinkingTool, is sent relative so it points at the coordinator's copy.
+                    target = os.path.relpath(os.path.realpath(path), os.path.dirname(os.path.abspath(path)))
+                outputs[file] = {"link": target}
+            elif path.exists():
+                outputs[file] = {"data": base64.b64encode(path.read_bytes()).decode("ascii")}
+        reply["outputs"] = outputs
+
+    return reply
+
+def Worker(address: str, retry: float = 10.0, persistent: bool = True, secret: Optional[Union[str, bytes]] = None) -> None:
+    """
+    Connects to a Build started with workers=address and runs the jobs it sends with the registered tools.
+    Run it from the same directory as the coordinator's Amake.py, after registering the same tools.
+
+    retry : keep trying to connect for this many seconds
+    persistent : reconnect after a build finishes, so one worker can serve several Build calls
+    secret : the coordinator's worker_secret, defaults to the ASSETFORGE_SECRET environment variable
+    """
+    family, addr = _parse_address(address)
+    key = _secret(secret, family)
+    tools = AssetForge().get_tools()
+
+    while True:
+        deadline = time.monotonic() + retry
+        sock = None
+
+        while sock is None:
+            try:
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.connect(addr)
+            except OSError:
+                sock.close()
+                sock = None
+                if time.monotonic() > deadline:
+                    return
+                time.sleep(0.2)
+
+        try:
+            challenge = _recv(sock)
+            if challenge is None:
+                return
+            nonce = os.urandom(16).hex()
+            _send(sock, {"type": "hello", "tools": [tool.tool_name() for tool in tools], "nonce": nonce,
+                         "proof": _proof(key, "worker", challenge["nonce"], nonce)})
+
+            start = _recv(sock)
+            if start is None:
+                return # rejected
+            if not hmac.compare_digest(str(start.get("proof")).encode("utf-8"), _proof(key, "coordinator", nonce, challenge["nonce"]).encode("utf-8")):
+                print(f"{address} doesn't know the secret, not taking jobs from it")
+                return
+
+            for tool in tools:
+                tool.start(Path(start["input_folder"]), Path(start["output_folder"]))
+            folders = [os.path.realpath(start["input_folder"]), os.path.realpath(start["output_folder"])]
+
+            while True:
+                message = _recv(sock)
+                if message is None or message["type"] == "bye":
+                    break
+                _send(sock, _run_worker_job(tools, message, start["hash_algorithm"], start["ship_outputs"], folders))
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+        if not persistent:
+            return
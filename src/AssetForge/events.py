@@ -0,0 +1,123 @@
+"""
+Structured build events and the sinks that consume them.
+
+Build(..., sinks=[...]) sends every sink a JobEvent when a job starts, finishes, fails or is found up to date.
+Build(..., quiet=False) uses a ProgressSink, which redraws one progress line at a fixed rate instead of printing a line per job.
+"""
+from pathlib import Path
+from typing import List, Callable, Optional, TextIO, NamedTuple
+
+import sys
+import json
+import time
+import threading
+
+class JobEvent(NamedTuple):
+    kind: str # "started", "finished", "cached" or "failed"
+    tool: str
+    file: Path
+    outputs: List[Path]
+    done: int # jobs finished (built or cached) so far; includes this job for "finished" and "cached", not for "started" or "failed"
+    todo: int
+    duration: float = 0.0 # seconds the job ran, for finished and failed
+    bytes_read: int = 0 # size of the input file and its dependencies
+    bytes_written: int = 0 # size of the outputs, for finished and cached
+    error: str = "" # the exception, for failed
+
+    def to_dict(self) -> dict:
+        event = self._asdict()
+        event["file"] = str(self.file)
+        event["outputs"] = [str(o) for o in self.outputs]
+        return event
+
+class EventSink:
+    """Receives the events of a build. emit is called from the building thread, close once the build is over."""
+    def emit(self, event: JobEvent) -> None:
+        raise NotImplementedError("Subclasses should implement this.")
+
+    def close(self) -> None:
+        pass
+
+class CallbackSink(EventSink):
+    """Calls callback(event) for every event, kinds limits it to some of them, e.g. ("finished", "cached")."""
+    def __init__(self, callback: Callable[[JobEvent], None], kinds: Optional[List[str]] = None):
+        self.callback = callback
+        self.kinds = kinds
+
+    def emit(self, event: JobEvent) -> None:
+        if self.kinds is None or event.kind in self.kinds:
+            self.callback(event)
+
+class JsonLinesSink(EventSink):
+    """Appends every event as a line of JSON to file_path (the time is added as "time", seconds since the epoch)."""
+    def __init__(self, file_path: Path):
+        self.file_path = file_path
+        self.file: Optional[TextIO] = None
+
+    def emit(self, event: JobEvent) -> None:
+        if self.file is None:
+            self.file = open(self.file_path, "a")
+
+        line = event.to_dict()
+        line["time"] = time.time()
+        self.file.write(json.dumps(line) + "\n")
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class ProgressSink(EventSink):
+    """
+    A progress bar that's redrawn at most every interval seconds, so a build of 100k cached jobs costs a few hundred
+    writes to the terminal instead of 100k. On something that isn't a terminal it writes a plain line each time instead.
+    Failures are always written right away.
+    """
+    def __init__(self, stream: Optional[TextIO] = None, interval: float = 0.1, width: int = 30):
+        self.stream = stream if stream is not None else sys.stdout
+        self.interval = interval
+        self.width = width
+        self.tty = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.last_draw = 0.0
+        self.last_event: Optional[JobEvent] = None
+        self.built = 0
+        self.cached = 0
+        self.lock = threading.Lock()
+
+    def _line(self, event: JobEvent) -> str:
+        fraction = event.done / event.todo if event.todo else 1.0
+        filled = int(self.width * fraction)
+        bar = "#" * filled + "-" * (self.width - filled)
+        return f"[{bar}] {int(100 * fraction):3d}% {event.done}/{event.todo} ({self.built} built, {self.cached} cached) {event.tool} \"{event.file}\""
+
+    def _draw(self, event: JobEvent) -> None:
+        if self.tty:
+            self.stream.write("\r\033[K" + self._line(event))
+        else:
+            self.stream.write(self._line(event) + "\n")
+        self.stream.flush()
+
+    def emit(self, event: JobEvent) -> None:
+        with self.lock:
+            if event.kind == "finished":
+                self.built += 1
+            elif event.kind == "cached":
+                self.cached += 1
+            elif event.kind == "failed":
+                self.stream.write(("\r\033[K" if self.tty else "") + f"{event.tool} failed on \"{event.file}\": {event.error}\n")
+
+            self.last_event = event
+
+            now = time.monotonic()
+            if now - self.last_draw >= self.interval:
+                self.last_draw = now
+                self._draw(event)
+                self.last_event = None
+
+    def close(self) -> None:
+        with self.lock:
+            if self.last_event is not None:
+                self._draw(self.last_event)
+            if self.tty and self.last_draw > 0:
+                self.stream.write("\n")
+                self.stream.flush()
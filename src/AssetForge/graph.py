@@ -0,0 +1,304 @@
+from pathlib import Path
+from typing import List, Dict, Set, Tuple, Optional, Iterable, Iterator, Any, Union
+
+from array import array
+
+import os
+
+_CHAIN_LIMIT = 8 # files sharing a name that are found by walking their chain, more get a folder -> file dict
+
+class PathTable:
+    """
+    Interns file paths into dense integer ids, so the rest of the graph can refer to files by index.
+
+    A path is split into its folder and its file name, both interned once, and a file is just the two ids.
+    Names are shared between folders, so assets/a/x.png and build/a/x.png store "x.png" once. A file is found
+    by walking the chain of files with its name (next_with_name); names used by more than _CHAIN_LIMIT files get
+    a folder -> file dict instead. Paths are joined back into strings on access, and into a Path only when a tool needs one.
+    """
+    __slots__ = ("folders", "folder_ids", "names", "name_ids", "folder_of", "name_of", "first_with_name", "name_count", "next_with_name", "crowded")
+
+    def __init__(self):
+        self.folders: List[str] = [] # with the trailing separator, so folder + name is the path
+        self.folder_ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.name_ids: Dict[str, int] = {}
+        self.folder_of = array("i")
+        self.name_of = array("i")
+        self.first_with_name = array("i")
+        self.name_count = array("i")
+        self.next_with_name = array("i")
+        self.crowded: Dict[int, Dict[int, int]] = {}
+
+    def _find(self, folder: int, name: int) -> int:
+        if self.name_count[name] > _CHAIN_LIMIT:
+            return self.crowded[name].get(folder, -1)
+
+        file_id = self.first_with_name[name]
+        while file_id >= 0 and self.folder_of[file_id] != folder:
+            file_id = self.next_with_name[file_id]
+        return file_id
+
+    def intern(self, path: Union[Path, str]) -> int:
+        key = str(path)
+        split = key.rfind(os.sep) + 1
+        folder_key, name_key = key[:split], key[split:]
+
+        folder = self.folder_ids.get(folder_key)
+        if folder is None:
+            folder = self.folder_ids[folder_key] = len(self.folders)
+            self.folders.append(folder_key)
+
+        name = self.name_ids.get(name_key)
+        if name is None:
+            name = self.name_ids[name_key] = len(self.names)
+            self.names.append(name_key)
+            self.first_with_name.append(-1)
+            self.name_count.append(0)
+
+        file_id = self._find(folder, name)
+        if file_id >= 0:
+            return file_id
+
+        file_id = len(self.folder_of)
+        self.folder_of.append(folder)
+        self.name_of.append(name)
+        self.next_with_name.append(self.first_with_name[name])
+        self.first_with_name[name] = file_id
+        self.name_count[name] += 1
+
+        if self.name_count[name] > _CHAIN_LIMIT:
+            crowded = self.crowded.get(name)
+            if crowded is None:
+                crowded = self.crowded[name] = {}
+                chained = self.next_with_name[file_id]
+                while chained >= 0:
+                    crowded[self.folder_of[chained]] = chained
+                    chained = self.next_with_name[chained]
+            crowded[folder] = file_id
+
+        return file_id
+
+    def get(self, path: Union[Path, str]) -> Optional[int]:
+        key = str(path)
+        split = key.rfind(os.sep) + 1
+
+        folder = self.folder_ids.get(key[:split])
+        name = self.name_ids.get(key[split:])
+        if folder is None or name is None:
+            return None
+
+        file_id = self._find(folder, name)
+        return file_id if file_id >= 0 else None
+
+    def path(self, file_id: int) -> Path:
+        return Path(self[file_id])
+
+    def __getitem__(self, file_id: int) -> str:
+        return self.folders[self.folder_of[file_id]] + self.names[self.name_of[file_id]]
+
+    def __len__(self) -> int:
+        return len(self.folder_of)
+
+class Job:
+    """
+    One run of a tool on an input file, a view of one job of a BuildGraph made on access.
+    inputs : file ids of the input file followed by the dependencies the tool defined
+    outputs : file ids of the files the tool writes
+    after : file ids of other jobs' outputs the job recorded reading, it's ordered after them but they aren't declared inputs
+    """
+    __slots__ = ("id", "tool", "file", "inputs", "outputs", "after")
+
+    def __init__(self, id: int, tool: Any, file: int, inputs: Tuple[int, ...], outputs: Tuple[int, ...], after: Tuple[int, ...] = ()):
+        self.id = id
+        self.tool = tool
+        self.file = file
+        self.inputs = inputs
+        self.outputs = outputs
+        self.after = after
+
+class JobList:
+    """graph.jobs: indexing, iterating and len() like a list of Jobs, while the graph only keeps flat arrays."""
+    __slots__ = ("graph",)
+
+    def __init__(self, graph: "BuildGraph"):
+        self.graph = graph
+
+    def __len__(self) -> int:
+        return len(self.graph.job_tool)
+
+    def __getitem__(self, job_id: int) -> Job:
+        graph = self.graph
+        inputs = tuple(graph.inputs[graph.input_offsets[job_id]:graph.input_offsets[job_id + 1]])
+        outputs = tuple(graph.outputs[graph.output_offsets[job_id]:graph.output_offsets[job_id + 1]])
+        return Job(job_id, graph.job_tool[job_id], inputs[0], inputs, outputs, graph.after.get(job_id, ()))
+
+    def __iter__(self) -> Iterator[Job]:
+        return (self[job_id] for job_id in range(len(self)))
+
+class BuildGraph:
+    """
+    The bipartite file/job graph of a build using integer ids.
+
+    Jobs are stored CSR style, without an object per job: the inputs of job j are inputs[input_offsets[j]:input_offsets[j + 1]]
+    (the input file first, then the defined dependencies) and its outputs are laid out the same way. The few jobs ordered
+    after files they only recorded reading keep those in the after dict. graph.jobs[j] builds a Job view of job j.
+
+    Every file has at most one producing job (-1 for root files), stored in a flat array. The reverse edges,
+    file -> jobs that read it, are stored CSR style too: the consumers of file f are
+    consumers[consumer_offsets[f]:consumer_offsets[f + 1]]. They are built once by freeze() after planning.
+    All arrays hold 4 byte ids.
+    """
+    def __init__(self):
+        self.paths = PathTable()
+        self.job_tool: List[Any] = []
+        self.input_offsets = array("i", [0])
+        self.inputs = array("i")
+        self.output_offsets = array("i", [0])
+        self.outputs = array("i")
+        self.after: Dict[int, Tuple[int, ...]] = {}
+        self.jobs = JobList(self)
+        self.producer = array("i")
+        self.consumer_offsets = array("i", [0])
+        self.consumers = array("i")
+
+    def add_file(self, path: Union[Path, str]) -> int:
+        file_id = self.paths.intern(path)
+        if file_id == len(self.producer):
+            self.producer.append(-1)
+        return file_id
+
+    def add_job(self, tool: Any, file: Path, dependencies: Iterable[Path], outputs: Iterable[Path]) -> Job:
+        job_id = len(self.job_tool)
+        inputs = tuple(dict.fromkeys([self.add_file(file)] + [self.add_file(d) for d in dependencies]))
+        outs = tuple(dict.fromkeys(self.add_file(o) for o in outputs))
+
+        self.job_tool.append(tool)
+        self.inputs.extend(inputs)
+        self.input_offsets.append(len(self.inputs))
+        self.outputs.extend(outs)
+        self.output_offsets.append(len(self.outputs))
+
+        for o in outs:
+            self.producer[o] = job_id
+
+        return Job(job_id, tool, inputs[0], inputs, outs)
+
+    def add_order(self, job: Job, paths: Iterable[Union[Path, str]]) -> None:
+        """Orders a job after the producers of paths without making them inputs, only valid before freeze()."""
+        job.after = tuple(f for f in dict.fromkeys(self.add_file(p) for p in paths) if f not in job.inputs)
+        if job.after:
+            self.after[job.id] = job.after
+
+    def edges(self, job: Job) -> Tuple[int, ...]:
+        """Every file the job has to wait for: its inputs and the files it's ordered after."""
+        return job.inputs + job.after if job.after else job.inputs
+
+    def _edges(self, job_id: int) -> Iterable[int]:
+        edges = self.inputs[self.input_offsets[job_id]:self.input_offsets[job_id + 1]]
+        after = self.after.get(job_id)
+        return edges.tolist() + list(after) if after else edges
+
+    def is_output(self, path: Union[Path, str]) -> bool:
+        file_id = self.paths.get(path)
+        return file_id is not None and self.producer[file_id] >= 0
+
+    def freeze(self) -> None:
+        """Builds the CSR consumer arrays, call it once every job has been added."""
+        num_files = len(self.paths)
+        num_jobs = len(self.job_tool)
+        offsets = array("i", bytes(array("i").itemsize * (num_files + 1)))
+
+        for job_id in range(num_jobs):
+            for f in self._edges(job_id):
+                offsets[f + 1] += 1
+
+        for f in range(num_files):
+            offsets[f + 1] += offsets[f]
+
+        consumers = array("i", bytes(array("i").itemsize * offsets[num_files]))
+        cursor = array("i", offsets)
+
+        for job_id in range(num_jobs):
+            for f in self._edges(job_id):
+                consumers[cursor[f]] = job_id
+                cursor[f] += 1
+
+        self.consumer_offsets = offsets
+        self.consumers = consumers
+
+    def consumers_of(self, file_id: int) -> array:
+        return self.consumers[self.consumer_offsets[file_id]:self.consumer_offsets[file_id + 1]]
+
+    def job_levels(self) -> List[List[int]]:
+        """
+        Groups the jobs into batches where every job only depends on jobs from earlier batches (Kahn's algorithm).
+        Raises ValueError if the graph has a cycle.
+        """
+        num_jobs = len(self.job_tool)
+        in_degree = array("i", bytes(array("i").itemsize * num_jobs))
+
+        for job_id in range(num_jobs):
+            in_degree[job_id] = sum(1 for f in self._edges(job_id) if self.producer[f] >= 0)
+
+        batch = [job_id for job_id in range(num_jobs) if in_degree[job_id] == 0]
+        levels = []
+        done = 0
+
+        while batch:
+            levels.append(batch)
+            done += len(batch)
+            next_batch = []
+
+            for job_id in batch:
+                for o in self.outputs[self.output_offsets[job_id]:self.output_offsets[job_id + 1]]:
+                    for consumer in self.consumers_of(o):
+                        in_degree[consumer] -= 1
+                        if in_degree[consumer] == 0:
+                            next_batch.append(consumer)
+
+            batch = next_batch
+
+        if done != num_jobs:
+            raise ValueError("Graph contains a cycle")
+
+        return levels
+
+    def tool_node(self, job: Job) -> str:
+        return f"{job.tool.tool_name()}#{job.id}"
+
+    def to_dict(self, levels: List[List[int]]) -> Tuple[Dict[str, Set[str]], List[Set[str]]]:
+        """
+        Expands the graph into the string keyed form used by the debug output: node -> set of nodes it depends on,
+        and the bipartite topological order where even levels are files and odd levels are tool nodes.
+        """
+        graph: Dict[str, Set[str]] = {}
+        order: List[Set[str]] = [set()]
+
+        for file_id, producer in enumerate(self.producer):
+            if producer < 0:
+                graph[self.paths[file_id]] = set()
+                order[0].add(self.paths[file_id])
+
+        for level, batch in enumerate(levels):
+            tools: Set[str] = set()
+            files: Set[str] = set()
+
+            for job_id in batch:
+                job = self.jobs[job_id]
+                node = self.tool_node(job)
+
+                graph[node] = set(self.paths[f] for f in self.edges(job))
+                tools.add(node)
+
+                for o in job.outputs:
+                    graph[self.paths[o]] = set([node])
+                    files.add(self.paths[o])
+
+            order.append(tools)
+            order.append(files)
+
+        while len(order) > 1 and not order[-1]:
+            order.pop()
+
+        return graph, order
@@ -0,0 +1,354 @@
+"""
+Mesh preprocessing used by common.MeshTool: OBJ parsing, vertex deduplication, normals and tangents,
+vertex cache optimization and the .mesh.bin writer. Needs numpy (pip install AssetForge[mesh]).
+
+.mesh.bin layout, little endian, ready to be copied into a vertex and an index buffer as is:
+
+    struct MeshHeader {             // 48 bytes
+        char     magic[4];          // "MESH"
+        uint32_t version;           // 1
+        uint32_t vertex_count;
+        uint32_t index_count;       // 3 per triangle
+        uint32_t vertex_stride;     // sizeof(MeshVertex), 48
+        uint32_t index_size;        // 2 (uint16_t) when vertex_count <= 65535, otherwise 4 (uint32_t)
+        float    bounds_min[3];
+        float    bounds_max[3];
+    };
+
+    struct MeshVertex {             // 48 bytes
+        float position[3];
+        float normal[3];
+        float uv[2];
+        float tangent[4];           // xyz tangent, w = +1/-1 handedness: bitangent = w * cross(normal, tangent)
+    };
+
+    MeshHeader header;
+    MeshVertex vertices[header.vertex_count];               // at byte 48
+    uintN_t    indices[header.index_count];                 // at byte 48 + 48 * vertex_count, triangle list, ccw
+"""
+from pathlib import Path
+from typing import Dict, Tuple
+
+import struct
+
+import numpy as np
+
+MESH_MAGIC = b"MESH"
+MESH_VERSION = 1
+HEADER_FORMAT = "<4sIIIII3f3f"
+
+VERTEX_DTYPE = np.dtype([("position", "<f4", 3), ("normal", "<f4", 3), ("uv", "<f4", 2), ("tangent", "<f4", 4)])
+
+def _parse_floats(lines, width: int) -> np.ndarray:
+    """Parses the numbers after the keyword of every line into a (len(lines), width) array, extra numbers are dropped."""
+    if not lines:
+        return np.zeros((0, width), dtype=np.float64)
+
+    values = np.array(" ".join(line.split(None, 1)[1] for line in lines).split(), dtype=np.float64)
+    if values.size == len(lines) * width:
+        return values.reshape(-1, width)
+
+    # Lines with a different number of values (e.g. "v x y z w" or vertex colors) mixed in, go one by one.
+    return np.array([line.split()[1:width + 1] for line in lines], dtype=np.float64)
+
+_INDEX_CHARACTERS = str.maketrans("", "", "0123456789+-")
+
+def _parse_corners(tokens) -> np.ndarray:
+    """Turns face corners like "1", "1/2", "1//3" or "1/2/3" into an (n, 3) array of position/uv/normal indices, 0 for a missing one."""
+    joined = " ".join(tokens)
+    pattern = tokens[0].translate(_INDEX_CHARACTERS) if tokens else ""
+    width = pattern.count("/") + 1
+
+    # Every corner has to have the first one's slashes, a matching count of numbers alone can come from mixed formats.
+    if joined.translate(_INDEX_CHARACTERS) == " ".join([pattern] * len(tokens)):
+        corners = np.array(joined.replace("//", "/0/").replace("/", " ").split(), dtype=np.int64).reshape(-1, width)
+    else:
+        # Mixed corner formats in one file, go one by one.
+        corners = np.array([(c.replace("//", "/0/").split("/") + ["0", "0"])[:3] for c in tokens], dtype=np.int64)
+
+    if corners.shape[1] < 3:
+        corners = np.hstack([corners, np.zeros((corners.shape[0], 3 - corners.shape[1]), dtype=np.int64)])
+    return corners
+
+def parse_obj(text: str) -> Dict[str, np.ndarray]:
+    """
+    Parses the geometry of a Wavefront OBJ file, polygons are triangulated as fans.
+    return : {"positions": (P, 3), "uvs": (T, 2), "normals": (N, 3), "corners": (3 * triangles, 3)} where every
+             corner row is the 0-based position/uv/normal index of a triangle corner, -1 for a missing uv or normal
+    """
+    lines = text.splitlines()
+
+    # Keywords can be followed (and preceded) by any whitespace, e.g. "v\t0 0 0".
+    keyword_kinds = {"v": 1, "vt": 2, "vn": 3, "f": 4}
+    kinds = np.array([keyword_kinds.get(line.split(None, 1)[0], 0) if line.strip() else 0 for line in lines], dtype=np.int8)
+
+    positions = _parse_floats([line for line, kind in zip(lines, kinds) if kind == 1], 3)
+    uvs = _parse_floats([line for line, kind in zip(lines, kinds) if kind == 2], 2)
+    normals = _parse_floats([line for line, kind in zip(lines, kinds) if kind == 3], 3)
+
+    face_lines = np.flatnonzero(kinds == 4)
+    faces = [lines[i].split()[1:] for i in face_lines]
+    counts = np.fromiter((len(f) for f in faces), dtype=np.int64, count=len(faces))
+    if np.any(counts < 3):
+        raise ValueError("OBJ face with less than 3 vertices")
+
+    tokens = [c for f in faces for c in f]
+    corners = _parse_corners(tokens)
+
+    # Negative indices count back from the last element defined before the face, so each face needs those counts.
+    for column, (kind, name, total) in enumerate(((1, "position", len(positions)), (2, "uv", len(uvs)), (3, "normal", len(normals)))):
+        defined = np.cumsum(kinds == kind)[face_lines]
+        before = np.repeat(defined, counts)
+        index = corners[:, column]
+        resolved = np.where(index > 0, index - 1, np.where(index < 0, before + index, -1))
+
+        bad = (resolved >= total) | ((index != 0) & (resolved < 0))
+        if column == 0:
+            bad |= index == 0
+        if np.any(bad):
+            corner = int(np.argmax(bad))
+            line = int(face_lines[np.searchsorted(np.cumsum(counts), corner, side="right")]) + 1
+            raise ValueError(f"OBJ face on line {line} refers to {name} {int(index[corner])}, but only {total} {name}s are defined")
+
+        corners[:, column] = resolved
+
+    # Fan triangulation: face corners (0, i, i + 1) for i in 1 .. n - 2, without a loop over the faces.
+    triangles_per_face = counts - 2
+    first_corner = np.cumsum(counts) - counts
+    face_of_triangle = np.repeat(np.arange(len(faces)), triangles_per_face)
+    i = np.arange(int(triangles_per_face.sum())) - np.repeat(np.cumsum(triangles_per_face) - triangles_per_face, triangles_per_face) + 1
+    start = first_corner[face_of_triangle]
+    triangle_corners = np.stack([start, start + i, start + i + 1], axis=1).reshape(-1)
+
+    return {"positions": positions, "uvs": uvs, "normals": normals, "corners": corners[triangle_corners]}
+
+def index_vertices(corners: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Deduplicates corners with the same position/uv/normal indices.
+    return : (unique corners (V, 3), index buffer (3 * triangles,))
+    """
+    if len(corners) == 0:
+        return corners, np.zeros(0, dtype=np.int64)
+
+    shifted = corners + 1 # -1 (missing) becomes 0 so the packed key stays positive
+    radix = [int(r) + 1 for r in shifted.max(axis=0)]
+
+    if radix[0] * radix[1] * radix[2] < 2 ** 63:
+        keys = (shifted[:, 0] * radix[1] + shifted[:, 1]) * radix[2] + shifted[:, 2]
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    else:
+        _, first, inverse = np.unique(corners, axis=0, return_index=True, return_inverse=True)
+
+    return corners[first], inverse.reshape(-1)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(lengths > 1e-20, lengths, 1.0)
+
+def compute_normals(positions: np.ndarray, position_index: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Smooth, area weighted vertex normals. Face normals are summed per position rather than per vertex,
+    so vertices split by a uv seam still get the same normal.
+    position_index : position of every vertex
+    """
+    triangles = position_index[indices].reshape(-1, 3)
+    p0, p1, p2 = positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]]
+    face_normals = np.cross(p1 - p0, p2 - p0) # length is twice the area
+
+    summed = np.zeros_like(positions)
+    for corner in range(3):
+        np.add.at(summed, triangles[:, corner], face_normals)
+
+    return _normalize(summed)[position_index]
+
+def compute_tangents(positions: np.ndarray, normals: np.ndarray, uvs: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    Per vertex tangents from the uv directions (Lengyel's method), orthogonalized against the normals,
+    with the handedness of the uv mapping in w. Vertices with degenerate uvs get any tangent perpendicular to the normal.
+    positions, normals, uvs : per vertex
+    return : (V, 4)
+    """
+    triangles = indices.reshape(-1, 3)
+    p0, p1, p2 = positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]]
+    t0, t1, t2 = uvs[triangles[:, 0]], uvs[triangles[:, 1]], uvs[triangles[:, 2]]
+
+    e1, e2 = p1 - p0, p2 - p0
+    d1, d2 = t1 - t0, t2 - t0
+
+    det = d1[:, 0] * d2[:, 1] - d2[:, 0] * d1[:, 1]
+    r = np.where(np.abs(det) > 1e-20, 1.0 / np.where(det == 0, 1.0, det), 0.0)[:, None]
+
+    face_tangents = (e1 * d2[:, 1:2] - e2 * d1[:, 1:2]) * r
+    face_bitangents = (e2 * d1[:, 0:1] - e1 * d2[:, 0:1]) * r
+
+    tangents = np.zeros_like(positions)
+    bitangents = np.zeros_like(positions)
+    for corner in range(3):
+        np.add.at(tangents, triangles[:, corner], face_tangents)
+        np.add.at(bitangents, triangles[:, corner], face_bitangents)
+
+    # Gram-Schmidt, falling back to an axis that isn't parallel to the normal.
+    tangents -= normals * np.sum(normals * tangents, axis=1, keepdims=True)
+    degenerate = np.linalg.norm(tangents, axis=1) < 1e-12
+    if np.any(degenerate):
+        n = normals[degenerate]
+        axis = np.where(np.abs(n[:, 0:1]) < 0.9, [[1.0, 0.0, 0.0]], [[0.0, 1.0, 0.0]])
+        tangents[degenerate] = axis - n * np.sum(n * axis, axis=1, keepdims=True)
+    tangents = _normalize(tangents)
+
+    handedness = np.where(np.sum(np.cross(normals, tangents) * bitangents, axis=1) < 0.0, -1.0, 1.0)
+    return np.hstack([tangents, handedness[:, None]])
+
+def tipsify(indices: np.ndarray, vertex_count: int, cache_size: int = 16) -> np.ndarray:
+    """
+    Reorders triangles for the post transform vertex cache with Tipsify (Sander, Nehab and Barczak,
+    "Fast Triangle Reordering for Vertex Locality and Reduced Overdraw", 2007).
+    Fans around one vertex at a time and moves on to a neighbour that's still in the cache, or to a
+    recently used vertex (dead end stack) when there's none. Linear in the number of triangles.
+    return : the reordered index buffer
+    """
+    triangle_count = len(indices) // 3
+    if triangle_count == 0:
+        return indices
+
+    # vertex -> triangles adjacency, CSR style
+    order = np.argsort(indices, kind="stable")
+    offsets = np.zeros(vertex_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=vertex_count), out=offsets[1:])
+
+    adjacency = (order // 3).tolist()
+    offsets = offsets.tolist()
+    corners = indices.tolist()
+    live = np.bincount(indices, minlength=vertex_count).tolist()
+
+    cache_time = [0] * vertex_count
+    emitted = bytearray(triangle_count)
+    dead_end = []
+    output = []
+
+    time = cache_size + 1
+    cursor = 0 # next vertex to try when stuck, in input order
+    fanning = 0
+
+    while fanning >= 0:
+        ring = []
+
+        for t in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[t]:
+                continue
+            emitted[t] = 1
+
+            for v in corners[3 * t:3 * t + 3]:
+                output.append(v)
+                dead_end.append(v)
+                ring.append(v)
+                live[v] -= 1
+                if time - cache_time[v] > cache_size:
+                    cache_time[v] = time
+                    time += 1
+
+        # Next: the neighbour with live triangles that will still be in the cache after fanning it and has been there longest.
+        best = -1
+        best_priority = -1
+        for v in ring:
+            if live[v] > 0:
+                priority = 0
+                if time - cache_time[v] + 2 * live[v] <= cache_size:
+                    priority = time - cache_time[v]
+                if priority > best_priority:
+                    best = v
+                    best_priority = priority
+
+        if best < 0:
+            # Dead end: a recently used vertex with live triangles, or the next one in input order.
+            while dead_end:
+                v = dead_end.pop()
+                if live[v] > 0:
+                    best = v
+                    break
+            while best < 0 and cursor < vertex_count:
+                if live[cursor] > 0:
+                    best = cursor
+                cursor += 1
+
+        fanning = best
+
+    return np.array(output, dtype=indices.dtype)
+
+def reorder_vertices(indices: np.ndarray, vertex_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Orders the vertices by first use in the index buffer, so the vertex fetches follow the triangle order.
+    Vertices no triangle uses are dropped.
+    return : (old vertex id of every new vertex, remapped index buffer)
+    """
+    used, first_use = np.unique(indices, return_index=True)
+    order = used[np.argsort(first_use)]
+
+    remap = np.full(vertex_count, -1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return order, remap[indices]
+
+def build_mesh(text: str, compute_normals_always: bool = False, optimize: bool = True, cache_size: int = 16) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs the whole pipeline on the text of an OBJ file.
+    compute_normals_always : ignore the normals in the file and compute smooth ones
+    return : (vertices with VERTEX_DTYPE, index buffer)
+    """
+    obj = parse_obj(text)
+    corners, indices = index_vertices(obj["corners"])
+
+    positions = obj["positions"][corners[:, 0]]
+
+    has_uvs = len(obj["uvs"]) > 0 and corners[:, 1].min() >= 0
+    uvs = obj["uvs"][corners[:, 1]] if has_uvs else np.zeros((len(corners), 2))
+
+    has_normals = not compute_normals_always and len(obj["normals"]) > 0 and corners[:, 2].min() >= 0
+    if has_normals:
+        normals = _normalize(obj["normals"][corners[:, 2]])
+    else:
+        normals = compute_normals(obj["positions"], corners[:, 0], indices)
+
+    tangents = compute_tangents(positions, normals, uvs, indices)
+
+    if optimize:
+        indices = tipsify(indices, len(corners), cache_size)
+    order, indices = reorder_vertices(indices, len(corners))
+
+    vertices = np.empty(len(order), dtype=VERTEX_DTYPE)
+    vertices["position"] = positions[order]
+    vertices["normal"] = normals[order]
+    vertices["uv"] = uvs[order]
+    vertices["tangent"] = tangents[order]
+
+    return vertices, indices
+
+def write_mesh_bin(file_path: Path, vertices: np.ndarray, indices: np.ndarray) -> None:
+    """Writes the .mesh.bin described at the top of this file."""
+    index_dtype = np.dtype("<u2") if len(vertices) <= 0xFFFF else np.dtype("<u4")
+
+    if len(vertices):
+        bounds_min = vertices["position"].min(axis=0)
+        bounds_max = vertices["position"].max(axis=0)
+    else:
+        bounds_min = bounds_max = np.zeros(3)
+
+    header = struct.pack(HEADER_FORMAT, MESH_MAGIC, MESH_VERSION, len(vertices), len(indices), VERTEX_DTYPE.itemsize, index_dtype.itemsize, *bounds_min, *bounds_max)
+
+    with open(file_path, "wb") as f:
+        f.write(header)
+        f.write(vertices.tobytes())
+        f.write(indices.astype(index_dtype).tobytes())
+
+def average_cache_miss_ratio(indices: np.ndarray, cache_size: int = 16) -> float:
+    """ACMR of a FIFO vertex cache, transformed vertices per triangle (0.5 is about the best a big mesh can get, 3 the worst)."""
+    cache = []
+    in_cache = set()
+    misses = 0
+    for v in indices.tolist():
+        if v not in in_cache:
+            misses += 1
+            cache.append(v)
+            in_cache.add(v)
+            if len(cache) > cache_size:
+                in_cache.discard(cache.pop(0))
+    return misses / max(1, len(indices) // 3)
@@ -1,24 +1,57 @@
 from typing import List, Dict, Tuple, Set, Callable, Any, Optional, Iterable, Union
 from pathlib import Path
 
-from graphviz import Digraph
-
 import threading
 import queue
+import json
 import re
 
 import hashlib
+import mmap
+import os
+import stat
+import shutil
+
+HASH_CHUNK_SIZE = 1 << 20       # bytes per read() when hashing a file
+HASH_MMAP_THRESHOLD = 1 << 24   # files at least this big are hashed through mmap instead
+
+_XXHASH_ALGORITHMS = {"xxh3": "xxh3_64", "xxh64": "xxh64", "xxh128": "xxh3_128"}
+
+def new_hasher(algorithm: str = "sha256"):
+    """
+    Returns a hasher with update()/digest()/hexdigest() for any hashlib algorithm (e.g. "sha256", "blake2b"),
+    or for "xxh3"/"xxh64"/"xxh128" when the optional xxhash package is installed.
+    """
+    if algorithm in _XXHASH_ALGORITHMS:
+        try:
+            import xxhash
+        except ImportError as e:
+            raise ImportError(f"hash algorithm \"{algorithm}\" needs the xxhash package (pip install xxhash)") from e
+        return getattr(xxhash, _XXHASH_ALGORITHMS[algorithm])()
+
+    return hashlib.new(algorithm)
+
+def hash_file(file_path : Path, algorithm: str = "sha256") -> bytes:
+    """Hashes a file's contents. A folder hashes to its recursive list of file names, so adding or removing a file changes it."""
+    hasher = new_hasher(algorithm)
+
+    if os.path.isdir(file_path):
+        for name in sorted(p.relative_to(file_path).as_posix() for p in Path(file_path).rglob("*")):
+            hasher.update(name.encode("utf-8") + b"\0")
+        return hasher.digest()
 
-def hash_file(file_path : Path) -> bytes:
-    hasher = hashlib.sha256()
     with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):  # Read in chunks to handle large files
-            hasher.update(chunk)
+        if os.fstat(f.fileno()).st_size >= HASH_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):  # Read in chunks to handle large files
+                hasher.update(chunk)
     return hasher.digest()
 
 def combine_hashes(items: Iterable[str], algorithm: str = "sha256") -> str:
     """Combines hashes from multiple sources and returns the final hex digest."""
-    combined_hasher = hashlib.new(algorithm)
+    combined_hasher = new_hasher(algorithm)
 
     for item in sorted(items):
         combined_hasher.update(item)
@@ -55,15 +88,6 @@ def invert_graph(graph:Graph) -> Graph:
 
     return inverted
 
-JobDict = Dict[
-    str,
-    Tuple[
-        Callable[..., Any],
-        Optional[Tuple[Any, ...]],
-        Optional[Dict[str, Any]],
-    ],
-]
-
 Order = List[Set[str]]
 
 def topological_sort(graph: Graph) -> Order:
@@ -102,32 +126,166 @@ def topological_sort(graph: Graph) -> Order:
 
     return result
 
-def viz_dependency_graph(dependencies, topological_order, output_file="graph"):
-    dot = Digraph(format="svg")
-    dot.attr(rankdir="LR")
+def node_label(node: str) -> str:
+    """Strips the job id off of a tool node ("LinkingTool#12" -> "LinkingTool"), file nodes are returned as is."""
+    match = re.match(r"^(\w+)#\d+$", node)
+    if match:
+        return match.group(1)
+    return node
+
+def _node_levels(topological_order: Order) -> Dict[str, int]:
+    return {node: level for level, nodes in enumerate(topological_order) for node in nodes}
+
+def subgraph_around(dependencies: Graph, topological_order: Order, focus: str, radius: int = 2) -> Tuple[Graph, Order]:
+    """
+    Cuts the graph down to the nodes at most radius edges away from focus, following edges both upstream and downstream.
+    Going from a file to the tool that made it is one edge, so a radius of 2 reaches the neighboring files.
+    """
+    dependees = invert_graph(dependencies)
+    kept = {focus}
+    frontier = [focus]
+
+    for _ in range(radius):
+        next_frontier = []
+        for node in frontier:
+            for neighbor in dependencies[node] | dependees[node]:
+                if neighbor not in kept:
+                    kept.add(neighbor)
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+
+    sub_graph = {node: deps & kept for node, deps in dependencies.items() if node in kept}
+    sub_order = [nodes & kept for nodes in topological_order]
+
+    while sub_order and not sub_order[-1]:
+        sub_order.pop()
+
+    return sub_graph, sub_order
+
+def collapse_fan_outs(dependencies: Graph, topological_order: Order, threshold: int) -> Tuple[Graph, Order]:
+    """
+    Merges repetitive parts of the graph into single nodes so that it stays readable.
+    Tool nodes are grouped by tool and level, then file nodes are grouped by level and by the (grouped) tools they connect to.
+    Every group with more than threshold nodes becomes one node labeled with its size, e.g. "LinkingTool x1000".
+    """
+    levels = _node_levels(topological_order)
+    dependees = invert_graph(dependencies)
+
+    group_of: Dict[str, Any] = {}
+
+    for node, level in levels.items():
+        if level % 2 == 1:
+            group_of[node] = ("tool", level, node_label(node))
+
+    for node, level in levels.items():
+        if level % 2 == 0:
+            neighbors = frozenset(group_of[n] for n in dependencies[node] | dependees[node])
+            group_of[node] = ("file", level, neighbors)
+
+    members: Dict[Any, List[str]] = {}
+    for node, group in group_of.items():
+        members.setdefault(group, []).append(node)
+
+    rename: Dict[str, str] = {}
+    for group, nodes in members.items():
+        if len(nodes) <= threshold:
+            for node in nodes:
+                rename[node] = node
+            continue
+
+        if group[0] == "tool":
+            name = f"{group[2]} x{len(nodes)}"
+        else:
+            suffixes = {"".join(Path(n).suffixes) for n in nodes}
+            name = f"*{suffixes.pop()} x{len(nodes)}" if len(suffixes) == 1 else f"files x{len(nodes)}"
+
+        # Keep names unique when two groups end up with the same label.
+        unique = name
+        count = 1
+        while unique in rename.values():
+            count += 1
+            unique = f"{name} ({count})"
+
+        for node in nodes:
+            rename[node] = unique
+
+    collapsed: Graph = {}
+    for node, deps in dependencies.items():
+        collapsed.setdefault(rename[node], set()).update(rename[d] for d in deps)
+
+    collapsed_order = [set(rename[n] for n in nodes) for nodes in topological_order]
+
+    return collapsed, collapsed_order
 
-    dot.attr("graph", compound="true")
-    dot.attr("node", shape="record", fontname="Courier")
-    dot.attr("edge", style="dashed", arrowhead="vee", splines="curved", tailport="e", headport="w")
+def _dot_quote(text: str) -> str:
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def dependency_graph_to_dot(dependencies: Graph, topological_order: Order) -> str:
+    """Writes the bipartite graph in the DOT language, doesn't need graphviz to be installed."""
+    lines = [
+        "digraph {",
+        "\trankdir=LR",
+        "\tgraph [compound=true]",
+        '\tnode [fontname=Courier shape=record]',
+        '\tedge [arrowhead=vee headport=w splines=curved style=dashed tailport=e]',
+    ]
 
     # Create a subgraph (cluster) for each topological level to align nodes
     for level, nodes in enumerate(topological_order):
-        with dot.subgraph(name=f"cluster_{level}") as sub:
-            sub.attr(rank="same", label=(f"Files {int((level - 0) / 2)}" if level != 0 else "Root Files") if level % 2 == 0 else f"Funcs {int((level - 1) / 2)}", fontsize="12", fontname="Courier")
-            sub.attr(align="left")
-            for node in nodes:
-                if re.match(r"^\w+_[a-fA-F0-9]{32}$", node):
-                    sub.node(node, label=node[:-33], style="filled", fillcolor="lightgrey")
-                else:
-                    sub.node(node, style="filled", fillcolor="lightblue")
+        label = (f"Files {int((level - 0) / 2)}" if level != 0 else "Root Files") if level % 2 == 0 else f"Funcs {int((level - 1) / 2)}"
+        lines.append(f"\tsubgraph cluster_{level} {{")
+        lines.append(f"\t\tlabel={_dot_quote(label)} align=left fontname=Courier fontsize=12 rank=same")
+        for node in sorted(nodes):
+            if level % 2 == 1:
+                lines.append(f"\t\t{_dot_quote(node)} [label={_dot_quote(node_label(node))} fillcolor=lightgrey style=filled]")
+            else:
+                lines.append(f"\t\t{_dot_quote(node)} [fillcolor=lightblue style=filled]")
+        lines.append("\t}")
 
     # Add edges
-    for node, deps in dependencies.items():
-        for dep in deps:
-            dot.edge(dep, node)
+    for node in sorted(dependencies):
+        for dep in sorted(dependencies[node]):
+            lines.append(f"\t{_dot_quote(dep)} -> {_dot_quote(node)}")
+
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def dependency_graph_to_json(dependencies: Graph, topological_order: Order) -> str:
+    """Dumps the bipartite graph as {"nodes": [...], "edges": [[from, to], ...]} for other tools to consume."""
+    levels = _node_levels(topological_order)
+
+    nodes = [
+        {"id": node, "label": node_label(node) if level % 2 == 1 else node, "kind": "tool" if level % 2 == 1 else "file", "level": level}
+        for node, level in sorted(levels.items(), key=lambda item: (item[1], item[0]))
+    ]
+    edges = [[dep, node] for node in sorted(dependencies) for dep in sorted(dependencies[node])]
+
+    return json.dumps({"nodes": nodes, "edges": edges}, indent=1)
+
+def viz_dependency_graph(dependencies, topological_order, output_file="graph", format="svg"):
+    """
+    Writes the dependency graph to output_file.<format>.
+    "dot" and "json" are written directly; any other format is rendered by graphviz, which is only imported here.
+    """
+    output_file = Path(output_file)
+
+    if format == "json":
+        output_file.with_name(output_file.name + ".json").write_text(dependency_graph_to_json(dependencies, topological_order))
+        return
+
+    source = dependency_graph_to_dot(dependencies, topological_order)
+
+    if format == "dot":
+        output_file.with_name(output_file.name + ".dot").write_text(source)
+        return
+
+    try:
+        import graphviz
+    except ImportError as e:
+        raise ImportError("graphviz is needed to render the debug graph; install it (pip install AssetForge[debug]) or use debug_format=\"dot\"") from e
 
     # Save and render
-    dot.render(output_file, format="svg", cleanup=True)
+    graphviz.Source(source).render(str(output_file), format=format, cleanup=True)
     # print(f"Graph saved as {output_file}.svg")
 
 class ThreadPool:
@@ -207,3 +365,229 @@ class ThreadPool:
         self.job_queue = queue.Queue()
         self.job_events.clear()
 
+FileRecord = Tuple[bytes, int, int] # digest, size, mtime in ns
+
+class FileHasher:
+    """
+    Hashes files for one build. Digests are memoized so a file read by several jobs is only hashed once,
+    and prefetch() hashes a batch of files on a ThreadPool (hashlib releases the GIL while hashing).
+    Call invalidate() after a file is rewritten.
+
+    known holds the records of the previous build. A file whose size and mtime still match its record
+    isn't read again, its recorded digest is reused (the same trust make and ninja put in mtimes).
+    Records with an mtime at or after known_time (when they were written, in ns) aren't trusted: on file systems
+    with coarse timestamps a file edited in the same tick as the last build would look unchanged ("racily clean" in git).
+    Files passed to invalidate() are always read again, whatever their size and mtime.
+    """
+    def __init__(self, algorithm: str = "sha256", num_threads: Optional[int] = None, known: Optional[Dict[str, FileRecord]] = None, known_time: Optional[int] = None):
+        new_hasher(algorithm) # fail early on unknown algorithms
+        self.algorithm = algorithm
+        self.num_threads = num_threads if num_threads is not None else (os.cpu_count() or 1)
+        self.known: Dict[str, FileRecord] = known if known is not None else {}
+        self.known_time = known_time
+        self.must_hash: Set[str] = set()
+        self.digests: Dict[str, bytes] = {}
+        self.stats: Dict[str, Tuple[int, int]] = {}
+        self.thread_pool: Optional[ThreadPool] = None
+
+    def _lookup(self, key: str) -> bool:
+        """Stats the file, and reuses its known digest if it hasn't changed since. Returns True if the digest is known now."""
+        try:
+            st = os.stat(key)
+        except OSError:
+            return False
+
+        self.stats[key] = (st.st_size, st.st_mtime_ns)
+
+        # A folder's mtime doesn't change when files are added to its subfolders, so folders are always listed again.
+        record = self.known.get(key)
+        if record is None or key in self.must_hash or stat.S_ISDIR(st.st_mode):
+            return False
+        if self.known_time is not None and record[2] >= self.known_time:
+            return False # racily clean, it could have changed in the same tick the record was written
+        if record[1:] == self.stats[key]:
+            self.digests[key] = record[0]
+            return True
+
+        return False
+
+    def digest(self, file_path: Union[Path, str]) -> bytes:
+        key = str(file_path)
+        digest = self.digests.get(key)
+        if digest is None:
+            if self._lookup(key):
+                return self.digests[key]
+            digest = hash_file(key, self.algorithm)
+            self.digests[key] = digest
+        return digest
+
+    def size(self, file_path: Union[Path, str]) -> int:
+        """Size of the file as of its last stat here, 0 if it hasn't been looked at."""
+        stats = self.stats.get(str(file_path))
+        return stats[0] if stats is not None else 0
+
+    def refresh(self, file_path: Union[Path, str]) -> None:
+        """Re-stats a file that was replaced by another with the same content (e.g. a link made by deduplicate), keeping its digest."""
+        key = str(file_path)
+        st = os.stat(key)
+        self.stats[key] = (st.st_size, st.st_mtime_ns)
+
+    def previous(self, file_path: Union[Path, str]) -> Optional[bytes]:
+        """The digest the file had in the previous build, if any."""
+        record = self.known.get(str(file_path))
+        return record[0] if record is not None else None
+
+    def _prefetch_one(self, key: str) -> None:
+        try:
+            self.digests[key] = hash_file(key, self.algorithm)
+        except OSError:
+            pass # missing files are reported by digest() if anyone actually needs them
+
+    def prefetch(self, file_paths: Iterable[Union[Path, str]]) -> None:
+        # Missing files don't get a stat and are skipped.
+        todo = [key for key in dict.fromkeys(str(f) for f in file_paths) if key not in self.digests and not self._lookup(key) and key in self.stats]
+
+        if self.num_threads <= 1 or len(todo) < 2:
+            for key in todo:
+                self._prefetch_one(key)
+            return
+
+        if self.thread_pool is None:
+            self.thread_pool = ThreadPool(self.num_threads)
+
+        for key in todo:
+            self.thread_pool.submit_job(self._prefetch_one, key)
+
+        self.thread_pool.wait_for_all_jobs()
+
+    def invalidate(self, file_paths: Iterable[Union[Path, str]]) -> None:
+        """Forgets the digests of rewritten files, they're hashed again even if their size and mtime match the known record."""
+        for f in file_paths:
+            self.digests.pop(str(f), None)
+            self.stats.pop(str(f), None)
+            self.must_hash.add(str(f))
+
+    def records(self) -> Dict[str, FileRecord]:
+        """Records of every file hashed (or trusted) during this build, to be passed as known to the next one."""
+        return {key: (digest,) + self.stats[key] for key, digest in self.digests.items() if key in self.stats}
+
+    def close(self) -> None:
+        if self.thread_pool is not None:
+            self.thread_pool.shutdown()
+            self.thread_pool = None
+
+def _in_store(file_path: str, store_folder: Optional[Path]) -> bool:
+    if store_folder is None:
+        return False
+    return os.path.realpath(file_path).startswith(os.path.realpath(store_folder) + os.sep)
+
+def _replace_atomically(file_path: str, make: Callable[[str], None]) -> None:
+    """make(tmp) creates the new file at tmp, which then replaces file_path in one rename."""
+    tmp = file_path + ".dedup-tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    make(tmp)
+    try:
+        os.replace(tmp, file_path)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+def release_shared(file_paths: Iterable[Union[Path, str]], store_folder: Optional[Path] = None) -> None:
+    """
+    Removes the files that share their storage with others: hardlinks (st_nlink > 1) and symlinks into store_folder.
+    Call it on a job's outputs before it runs, a tool that rewrites a deduplicated output in place would change every copy.
+    """
+    for f in file_paths:
+        try:
+            st = os.lstat(f)
+        except OSError:
+            continue
+        if (stat.S_ISREG(st.st_mode) and st.st_nlink > 1) or (stat.S_ISLNK(st.st_mode) and _in_store(str(f), store_folder)):
+            os.remove(f)
+
+def deduplicate(file_paths: Iterable[Union[Path, str]], hasher: FileHasher, mode: str = "hardlink", store_folder: Optional[Path] = None) -> Tuple[int, int]:
+    """
+    Makes files with identical contents share their storage, using the digests the hasher already has.
+    mode : "hardlink" hardlinks every copy to the first one, "store" keeps one copy per digest in store_folder
+           and replaces the files with relative symlinks to it (store entries nothing links to anymore are removed)
+    Symlinks (other than the ones into the store) and empty files are left alone, as are files that can't be linked
+    (e.g. on another file system).
+    return : (files linked by this call, bytes saved by all the shared files)
+    """
+    if mode not in ("hardlink", "store"):
+        raise ValueError(f"unknown dedup mode \"{mode}\", use \"hardlink\" or \"store\"")
+    if mode == "store" and store_folder is None:
+        raise ValueError("dedup mode \"store\" needs a store_folder")
+
+    groups: Dict[bytes, List[str]] = {}
+    for f in dict.fromkeys(str(p) for p in file_paths):
+        try:
+            st = os.lstat(f)
+            if stat.S_ISLNK(st.st_mode):
+                if mode != "store" or not _in_store(f, store_folder):
+                    continue
+            elif not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+                continue
+            groups.setdefault(hasher.digest(f), []).append(f)
+        except OSError:
+            continue
+
+    linked = 0
+    saved = 0
+    referenced = set()
+
+    for digest, files in groups.items():
+        size = hasher.size(files[0])
+
+        if mode == "hardlink":
+            if len(files) < 2:
+                continue
+
+            keep = os.stat(files[0])
+            shared = 1
+            for f in files[1:]:
+                st = os.lstat(f)
+                if (st.st_dev, st.st_ino) != (keep.st_dev, keep.st_ino):
+                    try:
+                        _replace_atomically(f, lambda tmp: os.link(files[0], tmp))
+                    except OSError:
+                        continue
+                    hasher.refresh(f)
+                    linked += 1
+                shared += 1
+            saved += size * (shared - 1)
+            continue
+
+        stored = os.path.join(store_folder, digest.hex())
+        if len(files) < 2 and not os.path.islink(files[0]):
+            continue
+
+        referenced.add(digest.hex())
+        if not os.path.exists(stored):
+            os.makedirs(store_folder, exist_ok=True)
+            source = next(f for f in files if not os.path.islink(f))
+            try:
+                _replace_atomically(stored, lambda tmp: os.link(source, tmp))
+            except OSError:
+                _replace_atomically(stored, lambda tmp: shutil.copyfile(source, tmp))
+
+        shared = 0
+        for f in files:
+            if not os.path.islink(f):
+                try:
+                    _replace_atomically(f, lambda tmp: os.symlink(os.path.relpath(stored, os.path.dirname(f)), tmp))
+                except OSError:
+                    continue
+                hasher.refresh(f)
+                linked += 1
+            shared += 1
+        saved += size * (shared - 1)
+
+    if mode == "store" and os.path.isdir(store_folder):
+        for name in os.listdir(store_folder):
+            if name not in referenced:
+                os.remove(os.path.join(store_folder, name))
+
+    return linked, saved
+